@@ -0,0 +1,119 @@
+"""Adaptive sampling: run each (model, prompt) cell only until its mention rate is known
+
+A cell is sampled until the Wilson interval on its mention rate is narrower
+than target_width (after at least min_runs answers), or until max_runs
+attempts. Cells that always or never mention Alan converge after a handful
+of runs; the calls saved go to the cells whose rate is still uncertain.
+"""
+import math
+from statistics import NormalDist
+
+
+def wilson_interval(successes, n, confidence=0.95):
+    """Wilson score interval (low, high) for a binomial proportion; (0, 1) when n is 0"""
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+class AdaptiveSampler:
+    """Running mention-rate intervals per (model, prompt) cell, and the next runs to make
+
+    record() takes every result row of the sweep; errored calls count as
+    attempts (towards max_runs) but not as answers.
+    """
+
+    def __init__(self, target_width=0.3, min_runs=5, max_runs=20, confidence=0.95, brand='Alan', budget=None):
+        if min_runs > max_runs:
+            raise ValueError("min_runs must not exceed max_runs")
+        self.target_width = target_width
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+        self.confidence = confidence
+        self.brand = brand
+        self.budget = budget
+        self.cells = {}
+        self.spent = 0
+
+    def cell(self, model, prompt):
+        return self.cells.setdefault((model, prompt), {"attempts": 0, "answers": 0, "mentions": 0, "last_run": 0})
+
+    def record(self, result, spent=True):
+        """Count one result row; spent=False for rows from an earlier session (resume)"""
+        cell = self.cell(result.get("model"), result.get("prompt"))
+        cell["attempts"] += 1
+        cell["last_run"] = max(cell["last_run"], result.get("run_number") or 0)
+        if result.get("status") == "success":
+            cell["answers"] += 1
+            cell["mentions"] += self.brand in (result.get("brands_mentioned") or ())
+        if spent:
+            self.spent += 1
+
+    def interval(self, cell):
+        return wilson_interval(cell["mentions"], cell["answers"], self.confidence)
+
+    def width(self, cell):
+        low, high = self.interval(cell)
+        return high - low
+
+    def done(self, cell):
+        if cell["attempts"] >= self.max_runs:
+            return True
+        return cell["answers"] >= self.min_runs and self.width(cell) < self.target_width
+
+    def answers_needed(self, cell):
+        """Answers after which the interval should be narrow enough if the observed rate holds"""
+        rate = cell["mentions"] / cell["answers"] if cell["answers"] else 0.5
+        for n in range(cell["answers"] + 1, self.max_runs + 1):
+            low, high = wilson_interval(round(rate * n), n, self.confidence)
+            if high - low < self.target_width:
+                return n
+        return self.max_runs
+
+    def next_wave(self, cells, slots):
+        """[(cell key, number of runs)] to schedule next, widest intervals first
+
+        Cells below min_runs get their remaining minimum runs. Past that, a
+        cell gets half the runs it is projected to still need (at least its
+        share of the `slots` worker slots, at most the projection), so the
+        projection is checked again before it can overshoot by much. Stops
+        at the call budget.
+        """
+        open_cells = [key for key in cells if not self.done(self.cell(*key))]
+        open_cells.sort(key=lambda key: -self.width(self.cell(*key)))
+        per_cell = math.ceil(slots / max(1, len(open_cells)))
+        remaining = None if self.budget is None else self.budget - self.spent
+        wave = []
+        for key in open_cells:
+            cell = self.cell(*key)
+            if cell["answers"] < self.min_runs:
+                runs = self.min_runs - cell["answers"]
+            else:
+                projected = max(1, self.answers_needed(cell) - cell["answers"])
+                runs = min(projected, max(per_cell, math.ceil(projected / 2)))
+            runs = min(runs, self.max_runs - cell["attempts"])
+            if remaining is not None:
+                runs = min(runs, remaining)
+                remaining -= runs
+            if runs > 0:
+                wave.append((key, runs))
+        return wave
+
+    def summary(self, cells=None):
+        """Cells converged, capped and open, and the calls spent in this session"""
+        cells = [self.cell(*key) for key in cells] if cells is not None else list(self.cells.values())
+        converged = sum(1 for cell in cells if cell["answers"] >= self.min_runs and self.width(cell) < self.target_width)
+        capped = sum(1 for cell in cells if self.done(cell)) - converged
+        return {
+            "cells": len(cells),
+            "converged": converged,
+            "capped": capped,
+            "open": len(cells) - converged - capped,
+            "calls": self.spent,
+            "fixed_calls": len(cells) * self.max_runs,
+        }
@@ -0,0 +1,150 @@
+import io
+import json
+import threading
+import time
+import uuid
+
+# Normalized job states returned by BatchBackend.status()
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Consecutive failed polls of a job before a sweep gives up on it
+MAX_POLL_FAILURES = 10
+
+
+class BatchBackend:
+    """A provider's asynchronous batch endpoint
+
+    submit() takes [{"custom_id": ..., "body": ...}] request lines and returns
+    a job id; status() reports RUNNING, COMPLETED or FAILED; results() yields
+    {"custom_id", "status_code", "body", "error"} for every request the
+    provider answered, successfully or not.
+    """
+
+    def submit(self, requests):
+        raise NotImplementedError
+
+    def status(self, job_id):
+        raise NotImplementedError
+
+    def results(self, job_id):
+        raise NotImplementedError
+
+
+def _to_jsonl(lines):
+    return "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+
+
+def _parse_output(text):
+    """Output lines share the same shape on OpenAI and Mistral"""
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        error = item.get("error")
+        yield {
+            "custom_id": item.get("custom_id"),
+            "status_code": response.get("status_code"),
+            "body": response.get("body"),
+            "error": (error.get("message") if isinstance(error, dict) else error),
+        }
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """OpenAI Batch API over /v1/responses"""
+
+    endpoint = "/v1/responses"
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, requests):
+        lines = [{"custom_id": r["custom_id"], "method": "POST", "url": self.endpoint, "body": r["body"]} for r in requests]
+        batch_file = self.client.files.create(file=("batch.jsonl", io.BytesIO(_to_jsonl(lines))), purpose="batch")
+        job = self.client.batches.create(input_file_id=batch_file.id, endpoint=self.endpoint, completion_window="24h")
+        return job.id
+
+    def status(self, job_id):
+        status = self.client.batches.retrieve(job_id).status
+        if status == "completed":
+            return COMPLETED
+        if status in ("failed", "expired", "cancelled"):
+            return FAILED
+        return RUNNING
+
+    def results(self, job_id):
+        job = self.client.batches.retrieve(job_id)
+        # Expired or cancelled jobs may still have answered part of the requests
+        for file_id in (job.output_file_id, job.error_file_id):
+            if file_id:
+                yield from _parse_output(self.client.files.content(file_id).text)
+
+
+class MistralBatchBackend(BatchBackend):
+    """Mistral batch jobs over /v1/chat/completions"""
+
+    endpoint = "/v1/chat/completions"
+
+    def __init__(self, client, model):
+        self.client = client
+        self.model = model
+
+    def submit(self, requests):
+        uploaded = self.client.files.upload(
+            file={"file_name": "batch.jsonl", "content": _to_jsonl(requests)},
+            purpose="batch",
+        )
+        job = self.client.batch.jobs.create(input_files=[uploaded.id], model=self.model, endpoint=self.endpoint)
+        return job.id
+
+    def status(self, job_id):
+        status = self.client.batch.jobs.get(job_id=job_id).status
+        if status == "SUCCESS":
+            return COMPLETED
+        if status in ("FAILED", "TIMEOUT_EXCEEDED", "CANCELLED"):
+            return FAILED
+        return RUNNING
+
+    def results(self, job_id):
+        job = self.client.batch.jobs.get(job_id=job_id)
+        for file_id in (job.output_file, job.error_file):
+            if file_id:
+                yield from _parse_output(self.client.files.download(file_id=file_id).read().decode("utf-8"))
+
+
+class FakeBatchBackend(BatchBackend):
+    """In-process batch endpoint for offline runs and tests
+
+    Jobs complete `delay` seconds after submission; each request body is
+    answered by respond(body), and an exception from respond becomes a
+    failed line, like a provider-side error would. Jobs live in memory, so
+    one resumed from another process's journal is FAILED with no output.
+    """
+
+    def __init__(self, respond, delay=0.0):
+        self.respond = respond
+        self.delay = delay
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, requests):
+        job_id = f"fake-batch-{uuid.uuid4().hex[:12]}"
+        with self.lock:
+            self.jobs[job_id] = (time.monotonic(), list(requests))
+        return job_id
+
+    def status(self, job_id):
+        if job_id not in self.jobs:
+            return FAILED  # submitted by an earlier process: its jobs died with it
+        submitted_at, _ = self.jobs[job_id]
+        return COMPLETED if time.monotonic() - submitted_at >= self.delay else RUNNING
+
+    def results(self, job_id):
+        _, requests = self.jobs.get(job_id, (None, []))
+        for request in requests:
+            try:
+                yield {"custom_id": request["custom_id"], "status_code": 200, "body": self.respond(request["body"]), "error": None}
+            except Exception as e:
+                yield {"custom_id": request["custom_id"], "status_code": 500, "body": None, "error": str(e)}
@@ -0,0 +1,170 @@
+"""Benchmark a sweep end to end against simulated providers
+
+Runs LLMRunner on mock providers (no API keys, no network) at increasing
+prompt counts, sequentially and concurrently, and prints one JSON object per
+case so results can be diffed between commits. The mocks go through the
+rate limiters of the providers they stand in for (config/rate_limits.json),
+whose waits are reported apart from call latency, and each case runs in a fresh process so its peak RSS is its own:
+
+    python -m src.benchmark --prompt-counts 10,50,200 --latency 0.05 --output data/bench.jsonl
+"""
+import argparse
+import contextlib
+import multiprocessing
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .journal import ResultJournal
+from .llm_runner import LLMRunner
+from .providers import load_model_config
+from .rate_limiter import load_rate_limits
+from .telemetry import percentile
+
+
+def default_models(latency, jitter, error_rate, rate_limit_rate):
+    """Four mock providers standing in for the real ones"""
+    labels = {"gpt-5": "openai", "gemini-2.5-flash": "gemini", "mistral-medium-2508": "mistral",
+              "perplexity-sonar": "perplexity"}
+    return [
+        {
+            "provider": "mock",
+            "label": f"mock-{label}",
+            "rate_limit": provider,
+            "latency": latency,
+            "latency_jitter": jitter,
+            "error_rate": error_rate,
+            "rate_limit_rate": rate_limit_rate,
+            "retry_after": latency,
+            "seed": seed,
+        }
+        for seed, (label, provider) in enumerate(labels.items())
+    ]
+
+
+def peak_rss_mb():
+    """Process high-water RSS in MB (ru_maxrss is KB on Linux, bytes on macOS)
+
+    This is the peak of the whole process, hence one process per case.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(models, num_prompts, num_iterations, concurrent, max_concurrency, rate_limits=None):
+    """Run one sweep and return its metrics (rate_limits: {} for no limiters, None for config/rate_limits.json)"""
+    runner = LLMRunner(models=models, rate_limits=rate_limits)
+    prompts = [f"Benchmark prompt {i}: what is the best health insurance for a startup?" for i in range(num_prompts)]
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = runner.run_all_tests(num_iterations, concurrent=concurrent, max_concurrency=max_concurrency, prompts=prompts)
+    wall = time.perf_counter() - start
+    # Provider.ask() times every call attempt (latency_seconds) apart from the
+    # time spent waiting on the rate limiters (queue_seconds)
+    timed = [r for r in results if r.get("latency_seconds") is not None]
+    latencies = [r["latency_seconds"] for r in timed]
+    waits = {}
+    for r in timed:
+        waits[r["model"]] = waits.get(r["model"], 0.0) + (r.get("queue_seconds") or 0.0)
+    queues = sorted(r.get("queue_seconds") or 0.0 for r in timed)
+
+    # Lower bound on wall time given the observed call latencies and limiter
+    # waits: the calls back to back after their waits, or spread perfectly over
+    # the worker pool but no sooner than the slowest provider's limiter allows
+    # (each provider's calls wait one after another).
+    busy = sum(latencies)
+    workers = max_concurrency if concurrent else 1
+    if concurrent:
+        ideal = max(busy / workers, max(latencies, default=0.0), max(waits.values(), default=0.0))
+    else:
+        ideal = busy + sum(queues)
+    latencies.sort()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        journal = ResultJournal(os.path.join(tmp, "journal.jsonl"))
+        for result in results:
+            journal.append(result)
+        journal_seconds = time.perf_counter() - start
+
+    csv_name = f"bench-{os.getpid()}.csv"
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        runner.save_to_csv(results, csv_name)
+    csv_seconds = time.perf_counter() - start
+    os.remove(os.path.join("data", csv_name))
+
+    return {
+        "mode": "concurrent" if concurrent else "sequential",
+        "prompts": num_prompts,
+        "iterations": num_iterations,
+        "models": len(runner.providers),
+        "max_concurrency": workers,
+        "rate_limited": any(provider.rate_limiter for provider in runner.providers),
+        "calls": len(results),
+        "errors": sum(1 for r in results if r.get("status") != "success"),
+        "wall_seconds": round(wall, 4),
+        "prompts_per_second": round(num_prompts * num_iterations / wall, 3),
+        "calls_per_second": round(len(results) / wall, 3),
+        "latency_p50": round(percentile(latencies, 50), 4),
+        "latency_p95": round(percentile(latencies, 95), 4),
+        "latency_p99": round(percentile(latencies, 99), 4),
+        "queue_p50": round(percentile(queues, 50), 4),
+        "queue_p95": round(percentile(queues, 95), 4),
+        "queue_p99": round(percentile(queues, 99), 4),
+        "queue_seconds_total": round(sum(queues), 4),
+        "scheduler_overhead_seconds": round(wall - ideal, 4),
+        "csv_seconds": round(csv_seconds, 4),
+        "journal_seconds": round(journal_seconds, 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark sweep throughput against mock providers")
+    parser.add_argument("--prompt-counts", default="10,50,200", help="comma-separated prompt counts")
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05, help="mean simulated call latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="+/- latency jitter (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--models", metavar="CONFIG", help="model config to benchmark instead of the default mocks")
+    parser.add_argument("--max-sequential-prompts", type=int, default=50,
+                        help="skip the sequential run above this many prompts")
+    parser.add_argument("--no-rate-limits", action="store_true",
+                        help="run without rate limiters (measures the scheduler alone)")
+    parser.add_argument("--output", help="append JSON lines here as well as printing them")
+    args = parser.parse_args(argv)
+    rate_limits = {} if args.no_rate_limits else load_rate_limits()
+
+    if args.models:
+        models = load_model_config(args.models)
+    else:
+        models = default_models(args.latency, args.jitter, args.error_rate, args.rate_limit_rate)
+    if args.no_rate_limits:
+        # No limiter to share: the mocks run unthrottled
+        models = [{key: value for key, value in entry.items() if key != "rate_limit"} for entry in models]
+
+    for num_prompts in [int(n) for n in args.prompt_counts.split(",")]:
+        modes = [True] if num_prompts > args.max_sequential_prompts else [False, True]
+        for concurrent in modes:
+            # A fresh process per case, so peak_rss_mb isn't the largest earlier case's
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                metrics = pool.submit(run_case, models, num_prompts, args.iterations, concurrent, args.max_concurrency,
+                                      rate_limits).result()
+            line = json.dumps(metrics)
+            print(line)
+            if args.output:
+                with open(args.output, 'a') as f:
+                    f.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of successful result rows
+
+    Entries are keyed on a hash of everything that determines the answer
+    (provider, model, sampling parameters, system prompt, tools, prompt and
+    run number) and stored one JSON file per key. ttl_seconds expires old
+    entries; max_bytes evicts least recently used entries once the cache
+    grows past it. In replay_only mode the runner never hits the network and
+    a miss becomes an error row.
+    """
+
+    def __init__(self, directory='data/cache', ttl_seconds=None, max_bytes=None, replay_only=False):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.replay_only = replay_only
+        self.lock = threading.Lock()
+        self.total_bytes = None
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        # Picklable for sharded runs; each process gets its own lock and size tally
+        state = dict(self.__dict__, total_bytes=None)
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, lock=threading.Lock())
+
+    @staticmethod
+    def make_key(**fields):
+        """Stable hash of the request fields"""
+        canonical = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Cached result row for key, or None on a miss or an expired entry"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if self.ttl_seconds is not None and time.time() - entry["stored_at"] > self.ttl_seconds:
+            self._remove(path)
+            return None
+        # Touch the file so mtime tracks last use for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return dict(entry["result"], cached=True)
+
+    def put(self, key, result):
+        """Store a result row atomically, then evict if over max_bytes"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"stored_at": time.time(), "result": result}, ensure_ascii=False, default=str)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        if self.max_bytes is None:
+            return
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for _, _, size in self._entries())
+            else:
+                self.total_bytes += os.path.getsize(path)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        """(mtime, path, size) for every cache file"""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, path, stat.st_size
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        entries = sorted(self._entries())
+        self.total_bytes = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._remove(path)
+            self.total_bytes -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
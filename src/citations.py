@@ -0,0 +1,193 @@
+"""Citations of web-connected providers, and an index of the domains they cite
+
+Extractors turn a provider response into (answer text, citation records) in
+one pass. A citation record is a dict with the CITATION fields of the
+results store: type ("web" or "file"), url, title, domain, date, file_id,
+quote.
+
+CitationIndex maps each cited domain to the answers citing it, so "which
+sources show up when Alan is recommended" is a lookup:
+
+    python -m src sources --brand Alan
+"""
+import argparse
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+
+
+def normalize_domain(url):
+    """Host of a URL, lowercased, without "www." or port; None if there is none"""
+    if not url:
+        return None
+    host = urlsplit(url if "//" in url else "//" + url).hostname
+    if not host:
+        return None
+    host = host.rstrip(".")
+    return host[4:] if host.startswith("www.") else host
+
+
+def web_citation(url, title=None, date=None):
+    return {"type": "web", "url": url, "title": title, "domain": normalize_domain(url), "date": date,
+            "file_id": None, "quote": None}
+
+
+def file_citation(file_id, quote=None):
+    return {"type": "file", "url": None, "title": None, "domain": None, "date": None, "file_id": file_id,
+            "quote": quote}
+
+
+def field(obj, name):
+    # SDK response objects and raw JSON bodies carry the same fields
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def extract_openai(output):
+    """(text, citations) from the `output` items of a Responses API response
+
+    Text and url_citation/file_citation annotations both live on the
+    output_text parts of message items, so they are collected in the same
+    walk. Citations are deduplicated in order of first appearance.
+    """
+    fragments = []
+    citations = {}
+    for item in output or []:
+        for content in field(item, "content") or []:
+            if field(content, "type") != "output_text":
+                continue
+            fragments.append(field(content, "text") or "")
+            for ann in field(content, "annotations") or []:
+                ann_type = field(ann, "type")
+                if ann_type == "url_citation" and field(ann, "url"):
+                    url = field(ann, "url")
+                    citations.setdefault(("web", url), web_citation(url, field(ann, "title")))
+                elif ann_type == "file_citation" and field(ann, "file_id"):
+                    file_id = field(ann, "file_id")
+                    citations.setdefault(("file", file_id), file_citation(file_id, field(ann, "quote")))
+    return "".join(fragments), list(citations.values())
+
+
+def extract_perplexity(body):
+    """Citations of a Perplexity chat completion body
+
+    search_results ({title, url, date}) are the richer form; the older
+    top-level citations list only has URLs. Both are merged by URL, in the
+    order the answer numbers them.
+    """
+    citations = {}
+    for url in body.get("citations") or []:
+        if url:
+            citations[url] = web_citation(url)
+    for result in body.get("search_results") or []:
+        url = result.get("url")
+        if url:
+            citations[url] = web_citation(url, result.get("title"), result.get("date"))
+    return list(citations.values())
+
+
+def index_key(result, run_date=None, sweep_id=None):
+    """(run_date, model, prompt, run_number[, sweep_id]): the same call on another day or sweep is another answer"""
+    key = (run_date or result.get("run_date"), result.get("model"), result.get("prompt"), result.get("run_number"))
+    sweep_id = sweep_id or result.get("sweep_id")
+    return key + (sweep_id,) if sweep_id else key
+
+
+class CitationIndex:
+    """Incremental index from cited domain to the answers citing it
+
+    Every added answer is appended to a JSONL file ({key, domains, brands})
+    and loaded back when the index is opened, so the index grows with each
+    sweep without re-reading the results store. Re-adding an answer (a
+    resumed or merged run) replaces its previous entry.
+    """
+
+    def __init__(self, path='data/citation_index.jsonl'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.answers = {}
+        self.by_domain = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._index(tuple(entry["key"]), entry["domains"], entry["brands"])
+
+    def _index(self, key, domains, brands):
+        previous = self.answers.get(key)
+        if previous is not None:
+            for domain in previous[0]:
+                self.by_domain[domain].discard(key)
+        self.answers[key] = (domains, brands)
+        for domain in domains:
+            self.by_domain.setdefault(domain, set()).add(key)
+
+    def add(self, result, run_date=None, sweep_id=None):
+        """Index one result row; rows without web citations are skipped"""
+        if result.get("status") != "success":
+            return
+        domains = list(dict.fromkeys(
+            c.get("domain") or normalize_domain(c.get("url")) for c in result.get("citations") or []
+        ))
+        domains = [domain for domain in domains if domain]
+        if not domains:
+            return
+        key = index_key(result, run_date, sweep_id)
+        brands = list(result.get("brands_mentioned") or [])
+        with self.lock:
+            self._index(key, domains, brands)
+            if self.path:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({"key": key, "domains": domains, "brands": brands}, ensure_ascii=False) + "\n")
+
+    def update(self, results, run_date=None, sweep_id=None):
+        for result in results:
+            self.add(result, run_date, sweep_id)
+
+    def lookup(self, domain):
+        """(run_date, model, prompt, run_number[, sweep_id]) of every answer citing domain"""
+        return sorted(self.by_domain.get(normalize_domain(domain) or domain, ()), key=str)
+
+    def sources_of(self, brand='Alan', models=None):
+        """Domains cited alongside brand: answers citing them, how many mention brand, and the rate"""
+        rows = []
+        for domain, keys in self.by_domain.items():
+            if models:
+                keys = [key for key in keys if key[1] in models]
+            if not keys:
+                continue
+            mentions = sum(1 for key in keys if brand in self.answers[key][1])
+            rows.append({"domain": domain, "answers": len(keys), "mentions": mentions,
+                         "rate": mentions / len(keys)})
+        return sorted(rows, key=lambda row: (-row["mentions"], -row["answers"], row["domain"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Domains cited by web-connected models")
+    parser.add_argument("--index", default='data/citation_index.jsonl')
+    parser.add_argument("--brand", default='Alan', help="count answers mentioning this brand")
+    parser.add_argument("--models", nargs="*", help="restrict to these model labels")
+    parser.add_argument("--domain", help="list the answers citing this domain instead")
+    parser.add_argument("--top", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    index = CitationIndex(args.index)
+    if args.domain:
+        for run_date, model, prompt, run_number in index.lookup(args.domain):
+            print(f"{run_date} | {model} | run {run_number} | {prompt}")
+        return
+    print(f"{'domain':<40} {'answers':>8} {args.brand + ' mentions':>16} {'rate':>6}")
+    for row in index.sources_of(args.brand, args.models)[:args.top]:
+        print(f"{row['domain']:<40} {row['answers']:>8} {row['mentions']:>16} {row['rate']:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Command-line entry point
+
+    python -m src run --iterations 10 --only gpt-5 perplexity-sonar
+    python -m src resume data/journal-20260101-120000.jsonl
+    python -m src run --processes 8
+    python -m src run --prompts config/prompt_matrix.json
+    python -m src run --shard 3/4 && python -m src merge data/shards
+    python -m src analyze --since 2026-01-01
+    python -m src diff --baseline 2026-01-01
+    python -m src sources --brand Alan
+    python -m src bench --prompt-counts 10,100
+
+Subcommands import only what they use: SDKs are loaded when a provider makes
+its first call, pandas/pyarrow only when results are stored or analyzed.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+
+# Options that decide which calls a run makes: saved next to its journal and reused by resume
+RUN_PARAMETERS = ("iterations", "prompts", "models", "only", "shard", "processes", "adaptive", "target_width",
+                  "min_runs", "confidence", "budget", "batch", "stream", "detection_only", "token_budget")
+
+
+def add_run_arguments(parser):
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--prompts", default='config/prompts.json',
+                        help="prompt list, or prompt matrix such as config/prompt_matrix.json")
+    parser.add_argument("--models", metavar="CONFIG", default='config/models.json', help="model list to run")
+    parser.add_argument("--only", nargs="+", metavar="MODEL", help="run only these model labels or provider names")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="calls in flight across all providers")
+    parser.add_argument("--sequential", action="store_true", help="one call at a time, in prompt order")
+    parser.add_argument("--cache", metavar="DIR", help="serve identical calls from an on-disk response cache")
+    parser.add_argument("--replay-only", action="store_true", help="answer from the cache only, never call the APIs")
+    parser.add_argument("--stream", action="store_true", help="use the streaming APIs and record time to first token")
+    parser.add_argument("--detection-only", action="store_true",
+                        help="stream and stop as soon as Alan is mentioned (or the token budget is spent)")
+    parser.add_argument("--token-budget", type=int, help="stop streams after about this many output tokens")
+    parser.add_argument("--batch", action="store_true",
+                        help="use the OpenAI/Mistral batch APIs (cheaper, results within 24h); other models run live")
+    parser.add_argument("--poll-interval", type=float, default=60, help="seconds between batch status checks")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="sample each prompt x model until its mention rate is known (--iterations is the cap)")
+    parser.add_argument("--target-width", type=float, default=0.3,
+                        help="adaptive: stop a cell once its confidence interval is narrower than this")
+    parser.add_argument("--min-runs", type=int, default=5, help="adaptive: answers per cell before it can stop")
+    parser.add_argument("--confidence", type=float, default=0.95, help="adaptive: confidence level of the intervals")
+    parser.add_argument("--budget", type=int, help="adaptive: stop after this many calls in total")
+    parser.add_argument("--store", default='data/results', help="Parquet results store to append to")
+    parser.add_argument("--csv", action="store_true", help="also export data/test_results.csv")
+    parser.add_argument("--show-responses", action="store_true", help="print every answer, not just a summary line")
+    parser.add_argument("--progress", type=float, default=10, metavar="SECONDS",
+                        help="print throughput, calls in flight, errors, 429s and ETA this often (0: never)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics during the run")
+    shards = parser.add_mutually_exclusive_group()
+    shards.add_argument("--shard", metavar="I/N", type=shard_spec,
+                        help="run only shard I of N (e.g. on N machines); results go to a shard journal, see merge")
+    shards.add_argument("--processes", type=int, help="split the sweep over this many worker processes")
+
+
+def shard_spec(value):
+    from .sharding import parse_shard
+
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def runner_options(args):
+    """LLMRunner keyword arguments for the run options (picklable, for worker processes)"""
+    from .cache import ResponseCache
+    from .providers import load_model_config, select_models
+
+    models = load_model_config(args.models)
+    if args.only:
+        models = select_models(models, args.only)
+    cache = None
+    if args.cache or args.replay_only:
+        cache = ResponseCache(args.cache or 'data/cache', replay_only=args.replay_only)
+    return {"models": models, "cache": cache, "stream": args.stream, "detection_only": args.detection_only,
+            "stream_token_budget": args.token_budget}
+
+
+def run(args, journal, resume):
+    from .llm_runner import LLMRunner
+    from .monitor import Monitor
+    from .sharding import scale_rate_limits
+
+    if args.processes:
+        return run_processes(args, journal, resume)
+    if args.adaptive and (args.batch or args.sequential):
+        raise SystemExit("--adaptive plans its calls in concurrent waves; it can't be combined with --batch or --sequential")
+    if args.adaptive and args.min_runs > args.iterations:
+        raise SystemExit("--adaptive needs --iterations (the per-cell cap) of at least --min-runs")
+
+    options = runner_options(args)
+    shard = args.shard
+    if shard:
+        # All shards draw on the same API keys
+        from .rate_limiter import load_rate_limits
+        options["rate_limits"] = scale_rate_limits(load_rate_limits(), shard[1])
+    runner = LLMRunner(**options)
+    prompts = runner._load_prompts(args.prompts)
+
+    print(f"Running full test on {describe_prompts(prompts)} x {len(runner.providers)} models (journal: {journal})...")
+    with Monitor(runner.telemetry, args.progress, args.metrics_port):
+        if args.adaptive:
+            results = runner.run_all_tests_adaptive(target_width=args.target_width, min_runs=args.min_runs,
+                                                    max_runs=args.iterations, confidence=args.confidence,
+                                                    budget=args.budget, max_concurrency=args.max_concurrency,
+                                                    journal=journal, resume=resume, prompts=prompts, shard=shard)
+        elif args.batch:
+            results = runner.run_all_tests_batch(num_iterations=args.iterations, poll_interval=args.poll_interval,
+                                                 max_concurrency=args.max_concurrency, journal=journal,
+                                                 resume=resume, prompts=prompts, shard=shard)
+        else:
+            results = runner.run_all_tests(num_iterations=args.iterations, concurrent=not args.sequential,
+                                           max_concurrency=args.max_concurrency, journal=journal, resume=resume,
+                                           prompts=prompts, shard=shard)
+
+    if shard:
+        # The other shards may still be running; merge stores them all at once
+        print(f"\nShard {shard[0]}/{shard[1]} done. Once every shard has finished, gather the shard journals "
+              f"in one directory and run: python -m src merge <directory>")
+        return
+    report(args, runner, results, sweep_of(journal))
+
+
+def describe_prompts(prompts):
+    return f"{len(prompts)} prompts" if hasattr(prompts, "__len__") else "the prompt matrix"
+
+
+def run_processes(args, directory, resume):
+    from .llm_runner import LLMRunner
+    from .sharding import merge_journals, run_sharded
+
+    if args.batch or args.sequential or args.adaptive:
+        raise SystemExit("--processes runs every shard concurrently; it can't be combined with --batch, --sequential "
+                         "or --adaptive (use --shard for adaptive runs)")
+    if args.metrics_port is not None:
+        raise SystemExit("--metrics-port serves the counters of one process; use --shard with one port per shard "
+                         "instead of --processes")
+    from .prompts import load_prompts
+
+    # Every worker process gets the whole list and keeps its own shard of it
+    prompts = list(load_prompts(args.prompts))
+    print(f"Running full test on {describe_prompts(prompts)} in {args.processes} processes "
+          f"(shard journals: {directory})...")
+    paths = run_sharded(directory, args.processes, runner_options(args), num_iterations=args.iterations,
+                        prompts=prompts, max_concurrency=args.max_concurrency, resume=resume)
+    report(args, LLMRunner(models=[]), list(merge_journals(paths)), sweep_of(directory))
+
+
+def merge(args):
+    from .llm_runner import LLMRunner
+    from .sharding import merge_journals, shard_journals
+
+    paths = shard_journals(args.directory)
+    if not paths:
+        raise SystemExit(f"No shard journals (shard-I-of-N.jsonl) in {args.directory}")
+    names = [os.path.basename(path) for path in paths]
+    count = int(names[0].split("-of-")[1].split(".")[0])
+    if names != [f"shard-{i}-of-{count}.jsonl" for i in range(1, count + 1)]:
+        print(f"Warning: incomplete or mixed shard set, merging {', '.join(names)}")
+    report(args, LLMRunner(models=[]), list(merge_journals(paths)), sweep_of(args.directory))
+
+
+def report(args, runner, results, sweep_id=None):
+    from .telemetry import Telemetry
+
+    # Show a brief summary of results
+    for result in results:
+        if result['status'] == 'success':
+            print(f"\n{result['model']} | run {result['run_number']}: Alan mentioned = {result['alan_mentioned']}")
+            if args.show_responses:
+                print("Response:")
+                print(result['response'])
+        else:
+            print(f"\n{result['model']} | run {result['run_number']}: ERROR - {result.get('error', 'Unknown error')}")
+
+    print("\n" + Telemetry().update(results).format_table())
+
+    # Save aggregated results
+    runner.save_to_store(results, args.store, sweep_id=sweep_id)
+    if args.csv:
+        runner.save_to_csv(results, "test_results.csv")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src", description="How do LLMs recommend Alan?")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run every prompt against every model")
+    add_run_arguments(run_parser)
+    run_parser.add_argument("--journal", help="journal file (default: data/journal-<timestamp>.jsonl, with --shard "
+                                              "data/shards/<timestamp>/shard-I-of-N.jsonl); with --processes, the "
+                                              "shard directory (default: data/shards/<timestamp>)")
+
+    resume_parser = commands.add_parser("resume", help="continue an interrupted run from its journal")
+    resume_parser.add_argument("journal", help="journal file (the shard directory with --processes)")
+    add_run_arguments(resume_parser)
+
+    merge_parser = commands.add_parser("merge", help="combine shard journals and store the results")
+    merge_parser.add_argument("directory", help="directory holding the shard-I-of-N.jsonl journals")
+    merge_parser.add_argument("--store", default='data/results', help="Parquet results store to append to")
+    merge_parser.add_argument("--csv", action="store_true", help="also export data/test_results.csv")
+    merge_parser.add_argument("--show-responses", action="store_true", help="print every answer, not just a summary line")
+
+    # analyze, bench, dedup, diff, prompts, rescore and sources keep their own argument parsers
+    commands.add_parser("analyze", help="aggregate statistics over stored results", add_help=False)
+    commands.add_parser("bench", help="benchmark sweep throughput against mock providers", add_help=False)
+    commands.add_parser("diff", help="compare a run with a baseline run and flag significant changes",
+                        add_help=False)
+    commands.add_parser("prompts", help="expand and check the prompt matrix", add_help=False)
+    commands.add_parser("dedup", help="cluster near-identical stored answers and keep one copy each", add_help=False)
+    commands.add_parser("rescore", help="recompute the brand mentions of stored answers", add_help=False)
+    commands.add_parser("sources", help="domains cited by web-connected models, and their Alan mention rate",
+                        add_help=False)
+
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "analyze":
+        from .analysis import main as analyze
+        return analyze(argv[1:])
+    if argv and argv[0] == "bench":
+        from .benchmark import main as bench
+        return bench(argv[1:])
+    if argv and argv[0] == "dedup":
+        from .dedup import main as dedup
+        return dedup(argv[1:])
+    if argv and argv[0] == "diff":
+        from .run_diff import main as diff
+        return diff(argv[1:])
+    if argv and argv[0] == "prompts":
+        from .prompts import main as prompts
+        return prompts(argv[1:])
+    if argv and argv[0] == "rescore":
+        from .rescore import main as rescore
+        return rescore(argv[1:])
+    if argv and argv[0] == "sources":
+        from .citations import main as sources
+        return sources(argv[1:])
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        journal = args.journal or default_journal(args)
+        save_parameters(args, journal)
+        run(args, journal, resume=False)
+    elif args.command == "resume":
+        restore_parameters(args, resume_parser, args.journal)
+        run(args, args.journal, resume=True)
+    elif args.command == "merge":
+        merge(args)
+
+
+def parameters_path(journal, processes=None):
+    """run.json in a shard directory, <journal>.run.json next to a journal file"""
+    if processes or os.path.isdir(journal):
+        return os.path.join(journal, "run.json")
+    return f"{journal}.run.json"
+
+
+def save_parameters(args, journal):
+    path = parameters_path(journal, args.processes)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({name: getattr(args, name) for name in RUN_PARAMETERS}, f, indent=2)
+
+
+def restore_parameters(args, parser, journal):
+    """Take the run's saved parameters for every option left at its default; refuse conflicting ones"""
+    path = parameters_path(journal)
+    if not os.path.exists(path):
+        print(f"Warning: no saved run parameters ({path}), resuming with the options given")
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        saved = json.load(f)
+    conflicts = []
+    for name, value in saved.items():
+        if name == "shard" and value is not None:
+            value = tuple(value)
+        given = getattr(args, name)
+        if given == parser.get_default(name):
+            setattr(args, name, value)
+        elif given != value:
+            conflicts.append(f"--{name.replace('_', '-')} {given} (the run used {value})")
+    if conflicts:
+        raise SystemExit(f"Resume options differ from the run's ({path}):\n  " + "\n  ".join(conflicts))
+
+
+def sweep_of(journal):
+    """Name of a sweep in the results store: its journal file or shard directory, without the extension"""
+    return os.path.splitext(os.path.basename(os.path.normpath(journal)))[0]
+
+
+def default_journal(args):
+    from .sharding import shard_journal_path
+
+    # A directory per sweep, so a later sweep never appends to an earlier one's journals
+    directory = f"data/shards/{datetime.now():%Y%m%d-%H%M%S}"
+    if args.shard:
+        return shard_journal_path(directory, *args.shard)
+    if args.processes:
+        return directory
+    return f"data/journal-{datetime.now():%Y%m%d-%H%M%S}.jsonl"
+
+
+if __name__ == "__main__":
+    main()
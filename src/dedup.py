@@ -0,0 +1,221 @@
+"""Near-duplicate answers: MinHash fingerprints, clusters and answer diversity
+
+Repeated runs of a prompt often get the same answer with a few words
+changed. Each stored response is fingerprinted with MinHash over word
+3-shingles (NumPy, no external service) and the answers of each (prompt,
+model) cell are clustered greedily: an answer joins the first cluster whose
+canonical answer it resembles (estimated Jaccard similarity >= threshold)
+and mentions the same brands, otherwise it starts a new cluster.
+
+dedup_store() rewrites the results store with a cluster_id on every row;
+only each cluster's canonical row keeps the response text, so the store
+shrinks and analyses read less. Mention fields stay on every row.
+
+    python -m src dedup --store data/results --threshold 0.8
+"""
+import argparse
+import hashlib
+import math
+import re
+import zlib
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .mentions import fold
+from .results_store import ResultsStore
+
+NUM_PERMUTATIONS = 64
+SHINGLE_SIZE = 3
+_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.default_rng(20240101)
+# Random hash functions h(x) = (a * x + b) mod p; a and x < 2^31 keep a * x + b within uint64
+_A = _rng.integers(1, 1 << 31, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 31, NUM_PERMUTATIONS, dtype=np.uint64)
+_WORD = re.compile(r"\w+")
+_token_hashes = {}
+
+
+def _shingle_hashes(text):
+    """31-bit hashes of the word 3-shingles of text (folded, lowercased)"""
+    tokens = _WORD.findall(fold(text).lower())
+    if not tokens:
+        return np.zeros(1, dtype=np.uint64)
+    hashes = np.fromiter(
+        (_token_hashes.get(t) or _token_hashes.setdefault(t, zlib.crc32(t.encode("utf-8"))) for t in tokens),
+        dtype=np.uint64, count=len(tokens),
+    )
+    if len(hashes) < SHINGLE_SIZE:
+        combined = hashes
+    else:
+        # Polynomial combination of consecutive token hashes (wraps around in uint64)
+        combined = hashes[:-2] * np.uint64(1000003) ** np.uint64(2) + hashes[1:-1] * np.uint64(1000003) + hashes[2:]
+    return np.unique(combined & np.uint64(0x7FFFFFFF))
+
+
+def minhash(text):
+    """MinHash signature (NUM_PERMUTATIONS uint64 values) of a response"""
+    shingles = _shingle_hashes(text or "")
+    return ((np.outer(shingles, _A) + _B) % _PRIME).min(axis=0)
+
+
+def similarity_matrix(signatures):
+    """Estimated Jaccard similarity between every pair of signatures"""
+    signatures = np.asarray(signatures)
+    return (signatures[:, None, :] == signatures[None, :, :]).mean(axis=2)
+
+
+def cluster(signatures, groups, threshold=0.8, leaders=()):
+    """Cluster labels (index of each answer's canonical answer), greedily in order
+
+    Answers only join a cluster whose canonical answer has the same group
+    (the brands it mentions). Indexes in `leaders` are taken as canonical
+    answers first, e.g. those kept by an earlier dedup pass.
+    """
+    n = len(signatures)
+    labels = np.full(n, -1)
+    if n == 0:
+        return labels
+    similar = similarity_matrix(signatures) >= threshold
+    canonical = []
+    leader_set = set(leaders)
+    order = list(leaders) + [i for i in range(n) if i not in leader_set]
+    for i in order:
+        for j in canonical:
+            if groups[j] == groups[i] and similar[i, j]:
+                labels[i] = j
+                break
+        else:
+            labels[i] = i
+            canonical.append(i)
+    return labels
+
+
+def diversity(labels, similarities=None):
+    """Answers, clusters, effective number of distinct answers (exp of the cluster-size entropy), mean similarity"""
+    labels = np.asarray(labels)
+    _, sizes = np.unique(labels, return_counts=True)
+    shares = sizes / sizes.sum()
+    stats = {
+        "answers": int(len(labels)),
+        "clusters": int(len(sizes)),
+        "effective_answers": round(float(math.exp(-(shares * np.log(shares)).sum())), 3),
+    }
+    if similarities is not None:
+        off_diagonal = similarities[~np.eye(len(labels), dtype=bool)]
+        stats["mean_similarity"] = round(float(off_diagonal.mean()), 3) if off_diagonal.size else 1.0
+    return stats
+
+
+def _cluster_id(run_date, model, prompt, run_number, sweep_id=None):
+    key = f"{run_date}|{model}|{prompt}|{run_number}" + (f"|{sweep_id}" if sweep_id else "")
+    return "c-" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def dedup_table(table, threshold=0.8):
+    """(deduplicated table, per-cell diversity rows) for one partition of the store
+
+    Rows without a response (errors, or non-canonical rows of an earlier
+    pass) keep their cluster_id. New rows are clustered against the earlier
+    pass's canonical rows, so deduplicating again after more runs of the
+    same day is incremental.
+    """
+    rows = table.to_pydict()
+    n = table.num_rows
+    cluster_ids = list(rows["cluster_id"])
+    canonical = list(rows["canonical"])
+    responses = rows["response"]
+    report = []
+
+    cells = {}
+    for i in range(n):
+        if rows["status"][i] == "success" and responses[i] is not None:
+            cells.setdefault(rows["prompt"][i], []).append(i)
+
+    for prompt, members in cells.items():
+        signatures = np.array([minhash(responses[i]) for i in members])
+        groups = [tuple(rows["brands_mentioned"][i] or ()) for i in members]
+        leaders = [k for k, i in enumerate(members) if canonical[i]]
+        labels = cluster(signatures, groups, threshold, leaders)
+        for k, i in enumerate(members):
+            leader = members[labels[k]]
+            if labels[k] == k and not canonical[i]:
+                cluster_ids[i] = _cluster_id(rows["run_date"][i], rows["model"][i], prompt, rows["run_number"][i],
+                                             rows["sweep_id"][i])
+            elif labels[k] != k:
+                cluster_ids[i] = cluster_ids[leader]
+            canonical[i] = bool(labels[k] == k)
+        report.append({"run_date": rows["run_date"][members[0]], "model": rows["model"][members[0]], "prompt": prompt,
+                       **diversity(labels, similarity_matrix(signatures))})
+
+    keep = pa.array([c is not False for c in canonical])
+    table = table.set_column(table.schema.get_field_index("cluster_id"), "cluster_id", pa.array(cluster_ids, pa.string()))
+    table = table.set_column(table.schema.get_field_index("canonical"), "canonical", pa.array(canonical, pa.bool_()))
+    response = pc.if_else(keep, table["response"], pa.scalar(None, pa.string()))
+    table = table.set_column(table.schema.get_field_index("response"), "response", response)
+    return table, report
+
+
+def check_restorable(table):
+    """Raise ValueError unless every answered row's cluster has its canonical text in table
+
+    Run on each rewritten partition before it replaces the old files, so a
+    dropped response can always be restored with canonical_responses().
+    """
+    answered = table.filter(pc.equal(table["status"], "success"))
+    kept = answered.filter(pc.is_valid(answered["response"]))
+    texts = set(kept["cluster_id"].to_pylist())
+    missing = set(answered["cluster_id"].to_pylist()) - texts
+    if None in texts or missing:
+        raise ValueError(f"Dedup would lose response texts: {len(missing)} clusters without a canonical row")
+
+
+def dedup_store(store=None, threshold=0.8, start_date=None, end_date=None):
+    """Deduplicate every partition of the store in place; returns the per-cell diversity rows"""
+    store = store or ResultsStore()
+    report = []
+    for (run_date, model), paths in sorted(store.partitions(start_date, end_date).items()):
+        table = store.read_files(paths)
+        answered = table.filter(pc.equal(table["status"], "success"))
+        if pc.all(pc.is_valid(answered["canonical"])).as_py():
+            continue  # already deduplicated, nothing new since
+        table, cells = dedup_table(table, threshold)
+        check_restorable(table)
+        store.replace_files(paths, table)
+        report.extend(cells)
+    return report
+
+
+def canonical_responses(store=None, **filters):
+    """{cluster_id: response} of the canonical rows, to restore the text of any row"""
+    store = store or ResultsStore()
+    table = store.load_table(columns=["cluster_id", "response"], status="success", **filters)
+    table = table.filter(pc.and_(pc.is_valid(table["response"]), pc.is_valid(table["cluster_id"])))
+    return dict(zip(table["cluster_id"].to_pylist(), table["response"].to_pylist()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cluster near-identical answers and keep one copy per cluster")
+    parser.add_argument("--store", default='data/results')
+    parser.add_argument("--threshold", type=float, default=0.8, help="estimated Jaccard similarity to join a cluster")
+    parser.add_argument("--since", help="first run date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="last run date (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    report = dedup_store(ResultsStore(args.store), args.threshold, args.since, args.until)
+    if not report:
+        print("Nothing to deduplicate")
+        return
+    answers = sum(row["answers"] for row in report)
+    clusters = sum(row["clusters"] for row in report)
+    print(f"{answers} answers in {len(report)} prompt x model cells -> {clusters} clusters "
+          f"({answers - clusters} response texts dropped)")
+    print(f"\n{'model':<24} {'answers':>7} {'clusters':>8} {'effective':>9} {'similarity':>10}  prompt")
+    for row in sorted(report, key=lambda row: row["effective_answers"], reverse=True):
+        print(f"{row['model']:<24} {row['answers']:>7} {row['clusters']:>8} {row['effective_answers']:>9} "
+              f"{row['mean_similarity']:>10}  {row['prompt'][:60]}")
+
+
+if __name__ == "__main__":
+    main()
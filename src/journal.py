@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+
+
+def result_key(result):
+    """Identity of a result row: (model, prompt, run_number)"""
+    return (result.get("model"), result.get("prompt"), result.get("run_number"))
+
+
+class ResultJournal:
+    """Append-only JSONL journal of result rows, written as soon as each call returns
+
+    Iterating over the journal streams the rows back from disk, so it can be
+    passed wherever a list of results is expected without loading the whole
+    sweep into memory.
+    """
+
+    def __init__(self, path='data/journal.jsonl'):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def batches_path(self):
+        """JSONL side file of the batch jobs submitted for this journal's sweep"""
+        return f"{self.path}.batches"
+
+    def _write_line(self, path, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def append(self, result):
+        """Write one result row and flush it to disk"""
+        self._write_line(self.path, result)
+
+    def rows(self, path=None):
+        """Every row as written, including errored attempts later retried on resume"""
+        path = path or self.path
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line may be truncated if the process was killed mid-write
+                    continue
+
+    def __iter__(self):
+        """One row per key: a success wins over an error, otherwise the last row written
+
+        The file is read twice, once for the keys and once for the rows, so
+        only the keys are held in memory.
+        """
+        kept = {}
+        for position, result in enumerate(self.rows()):
+            key = result_key(result)
+            previous = kept.get(key)
+            if previous is None or result.get("status") == "success" or not previous[1]:
+                kept[key] = (position, result.get("status") == "success")
+        positions = {position for position, _ in kept.values()}
+        for position, result in enumerate(self.rows()):
+            if position in positions:
+                yield result
+
+    def completed_keys(self):
+        """Keys of successful rows; errored calls are retried on resume"""
+        return {result_key(result) for result in self.rows() if result.get("status") == "success"}
+
+    def add_batch(self, model, job_id, calls):
+        """Record a submitted batch job and its {custom_id: (prompt, run_number)} calls, before polling it"""
+        self._write_line(self.batches_path, {"model": model, "job_id": job_id, "calls": calls})
+
+    def finish_batch(self, job_id):
+        """Record that a batch job's output is in the journal"""
+        self._write_line(self.batches_path, {"job_id": job_id, "merged": True})
+
+    def open_batches(self):
+        """{job_id: (model, calls)} of the recorded batch jobs not merged yet, for resume to poll"""
+        batches = {}
+        for line in self.rows(self.batches_path):
+            if line.get("merged"):
+                batches.pop(line["job_id"], None)
+            else:
+                calls = {custom_id: tuple(call) for custom_id, call in line["calls"].items()}
+                batches[line["job_id"]] = (line["model"], calls)
+        return batches
@@ -1,30 +1,119 @@
 import os
-import requests
-import json
-import time
+import sys
 import csv
-from datetime import datetime
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from dotenv import load_dotenv
 
-# Import your working clients
-from openai import OpenAI
-import google.generativeai as genai
-from mistralai.sdk import Mistral
+from .adaptive import AdaptiveSampler
+from .batch import MAX_POLL_FAILURES, RUNNING
+from .cache import ResponseCache
+from .citations import CitationIndex
+from .journal import ResultJournal
+from .mentions import default_detector
+from .prompts import load_prompts
+from .providers import create_provider, load_model_config
+from .rate_limiter import build_rate_limiters
+from .sharding import in_shard
+from .telemetry import Telemetry, load_prices
 
 load_dotenv()
 
 class LLMRunner:
-    def __init__(self):
-        # Initialize all clients
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-        self.gemini_model = genai.GenerativeModel('gemini-2.5-flash')  # Updated to requested model
-        
-        self.mistral_client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
+    def __init__(self, models=None, rate_limits=None, cache=None, stream=False, detection_only=False,
+                 stream_token_budget=None, stop_brands=("Alan",), prices=None):
+        # One limiter per provider (requests/min + tokens/min), see rate_limiter.py
+        self.rate_limiters = build_rate_limiters(rate_limits)
+
+        # Price table for the cost_usd of each call (config/prices.json), and
+        # live per-model counters of every result recorded by the run methods
+        self.prices = load_prices() if prices is None else prices
+        self.telemetry = Telemetry()
+
+        # Models to run, as {"provider": name, **options} entries (see config/models.json)
+        if models is None:
+            models = load_model_config()
+        self.providers = [self._build_provider(dict(entry)) for entry in models]
+
+        # Optional ResponseCache (or cache directory) in front of the providers
+        if isinstance(cache, str):
+            cache = ResponseCache(cache)
+        self.cache = cache
+
+        # Streaming mode records time-to-first-token; detection_only also cancels
+        # the stream once every stop brand (canonical names from config/brands.json)
+        # has been seen or the token budget is spent
+        self.stream = stream or detection_only
+        self.detection_only = detection_only
+        self.stream_token_budget = stream_token_budget
+        self.stop_brands = set(stop_brands)
+        self.detector = default_detector()
+
+    def _build_provider(self, entry):
+        name = entry.pop("provider")
+        label = entry.get("label")
+        # An entry may name the limiter it shares ("rate_limit": "openai", e.g. for
+        # a mock standing in for OpenAI); otherwise a limiter configured for this
+        # exact model label wins over the provider-wide one
+        shared = entry.pop("rate_limit", None)
+        if shared is not None:
+            if shared not in self.rate_limiters:
+                raise ValueError(f"{label or name}: no rate limit configured for {shared!r}")
+            limiter = self.rate_limiters[shared]
+        else:
+            limiter = self.rate_limiters.get(label) or self.rate_limiters.get(name)
+        return create_provider(name, rate_limiter=limiter, prices=self.prices, **entry)
+
+    def _mentions_decided(self, text):
+        return self.stop_brands.issubset(self.detector.detect(text, partial=True)["offsets"])
+
+    def _ask_live(self, provider, prompt, run_number, acquired=False):
+        def on_retry(error, delay):
+            self.telemetry.rate_limit(provider.label)
+
+        def in_flight():
+            # Entered around each attempt sent, so calls waiting on the limiter aren't counted
+            return self.telemetry.sending(provider.label)
 
-        # Perplexity doesn't need a special client, just requests
-        self.perplexity_api_key = os.getenv("PERPLEXITY_API_KEY")
+        if not self.stream:
+            return provider.ask(prompt, run_number, on_retry=on_retry, in_flight=in_flight, acquired=acquired)
+        return provider.ask_stream(
+            prompt,
+            run_number,
+            should_stop=self._mentions_decided if self.detection_only else None,
+            token_budget=self.stream_token_budget,
+            on_retry=on_retry,
+            in_flight=in_flight,
+            acquired=acquired,
+        )
+
+    def _cache_key(self, provider, prompt, run_number):
+        return self.cache.make_key(prompt=prompt, run_number=run_number, **provider.cache_fields())
+
+    def ask(self, provider, prompt, run_number):
+        """Ask one provider, serving the call from the response cache when possible"""
+        return self._from_cache(provider, prompt, run_number) or self._ask_uncached(provider, prompt, run_number)
+
+    def _from_cache(self, provider, prompt, run_number):
+        """The row to use instead of calling the provider (a cache hit, or a replay-only miss), else None"""
+        if self.cache is None:
+            return None
+        cached = self.cache.get(self._cache_key(provider, prompt, run_number))
+        if cached is not None:
+            return cached
+        if self.cache.replay_only:
+            return provider.error_row(prompt, run_number, "cache miss (replay-only mode)")
+        return None
+
+    def _ask_uncached(self, provider, prompt, run_number, acquired=False):
+        """Call the provider and cache a complete answer"""
+        result = self._ask_live(provider, prompt, run_number, acquired)
+        # Streams cut short hold a partial answer, which must not be replayed as a full one
+        if self.cache is not None and result.get("status") == "success" and not result.get("stream_stop_reason"):
+            self.cache.put(self._cache_key(provider, prompt, run_number), result)
+        return result
 
     def _extract_openai_message_text(self, response):
         """Best-effort extraction of message text from OpenAI ChatCompletion response."""
@@ -49,217 +138,389 @@ class LLMRunner:
         # Fallback to stringified response for visibility
         return str(response)
     
-    def ask_openai(self, prompt, run_number):
-        """Ask OpenAI via Responses API with web search and citation extraction"""
-        try:
-            response = self.openai_client.responses.create(
-                model="gpt-5",
-                input=[
-                    {"role": "system", "content": "You are a helpful assistant. Cite your sources when possible."},
-                    {"role": "user", "content": prompt}
-                ],
-                tools=[
-                    {"type": "web_search"}
-                ],
-                # max_output_tokens=500,
-            )
-
-            # Extract combined text answer
-            message_content = getattr(response, "output_text", None)
-            if not message_content:
-                fragments = []
-                try:
-                    for item in getattr(response, "output", []) or []:
-                        for content in getattr(item, "content", []) or []:
-                            if getattr(content, "type", None) == "output_text" and getattr(content, "text", None):
-                                value = getattr(content.text, "value", None) or getattr(content.text, "content", None)
-                                if value:
-                                    fragments.append(value)
-                except Exception:
-                    pass
-                message_content = "\n".join(fragments) if fragments else ""
-
-            # Collect citations from annotations if present
-            citations = []
-            try:
-                seen = set()
-                for item in getattr(response, "output", []) or []:
-                    for content in getattr(item, "content", []) or []:
-                        if getattr(content, "type", None) == "output_text" and getattr(content, "text", None):
-                            annotations = getattr(content.text, "annotations", None) or []
-                            for ann in annotations:
-                                ann_type = getattr(ann, "type", None)
-                                if ann_type == "web_citation":
-                                    url = getattr(ann, "url", None)
-                                    title = getattr(ann, "title", None)
-                                    key = (url, title)
-                                    if url and key not in seen:
-                                        citations.append({"type": "web", "url": url, "title": title})
-                                        seen.add(key)
-                                elif ann_type == "file_citation":
-                                    file_id = getattr(getattr(ann, "file_citation", None), "file_id", None)
-                                    quote = getattr(getattr(ann, "file_citation", None), "quote", None)
-                                    key = (file_id, quote)
-                                    if file_id and key not in seen:
-                                        citations.append({"type": "file", "file_id": file_id, "quote": quote})
-                                        seen.add(key)
-            except Exception:
-                pass
-
-            # Append citations as a Markdown table after the raw answer (schema unchanged)
-            if citations:
-                lines = [message_content, "", "Citations:", "", "| # | Type | Title/Quote | URL / File ID |", "|---:|------|-------------|----------------|"]
-                for idx, c in enumerate(citations, start=1):
-                    if c["type"] == "web":
-                        title_or_quote = c.get("title") or ""
-                        ref = c.get("url") or ""
-                        lines.append(f"| {idx} | web | {title_or_quote} | {ref} |")
-                    elif c["type"] == "file":
-                        title_or_quote = c.get("quote") or ""
-                        ref = c.get("file_id") or ""
-                        lines.append(f"| {idx} | file | {title_or_quote} | {ref} |")
-                message_content = "\n".join(lines)
-
-            return {
-                "model": "gpt-5",
-                "prompt": prompt,
-                "response": message_content,
-                "run_number": run_number,
-                "timestamp": datetime.now().isoformat(),
-                "alan_mentioned": "alan" in (message_content or "").lower(),
-                "status": "success"
-            }
-        except Exception as e:
-            return {"model": "gpt-5", "prompt": prompt, "error": str(e), "status": "error", "run_number": run_number}
-    
-    def ask_gemini(self, prompt, run_number):
-        """Ask Google Gemini"""
-        try:
-            response = self.gemini_model.generate_content(prompt)
-            return {
-                "model": "gemini-2.5-flash",
-                "prompt": prompt,
-                "response": response.text,
-                "run_number": run_number,
-                "timestamp": datetime.now().isoformat(),
-                "alan_mentioned": "alan" in response.text.lower(),
-                "status": "success"
-            }
-        except Exception as e:
-            return {"model": "gemini-2.5-flash", "prompt": prompt, "error": str(e), "status": "error", "run_number": run_number}
-    
-    def ask_perplexity(self, prompt, run_number):
-        """Ask Perplexity (web-connected search model)"""
-        try:
-            url = "https://api.perplexity.ai/chat/completions"
-            
-            headers = {
-                "Authorization": f"Bearer {self.perplexity_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": "sonar",
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": 500,
-                "temperature": 0.7
-            }
-            
-            response = requests.post(url, headers=headers, json=data)
-            
-            if response.status_code == 200:
-                result = response.json()
-                answer = result['choices'][0]['message']['content']
-                
-                return {
-                    "model": "perplexity-sonar",
-                    "prompt": prompt,
-                    "response": answer,
-                    "run_number": run_number,
-                    "timestamp": datetime.now().isoformat(),
-                    "alan_mentioned": "alan" in answer.lower(),
-                    "web_connected": True,
-                    "status": "success"
-                }
-            else:
-                return {
-                    "model": "perplexity-sonar",
-                    "prompt": prompt,
-                    "error": f"HTTP {response.status_code}: {response.text}",
-                    "status": "error",
-                    "run_number": run_number
-                }
-                
-        except Exception as e:
-            return {
-                "model": "perplexity-sonar",
-                "prompt": prompt,
-                "error": str(e),
-                "status": "error",
-                "run_number": run_number
-            }
-
-    def ask_mistral(self, prompt, run_number):
-        """Ask Mistral"""
-        try:
-            messages = [{"role": "user", "content": prompt}]
-            response = self.mistral_client.chat.complete(
-                model="mistral-medium-2508",
-                messages=messages,
-                max_tokens=500,
-                temperature=0.7
-            )
-            return {
-                "model": "mistral-medium-2508",
-                "prompt": prompt,
-                "response": response.choices[0].message.content,
-                "run_number": run_number,
-                "timestamp": datetime.now().isoformat(),
-                "alan_mentioned": "alan" in response.choices[0].message.content.lower(),
-                "status": "success"
-            }
-        except Exception as e:
-            return {"model": "mistral-medium-2508", "prompt": prompt, "error": str(e), "status": "error", "run_number": run_number}
-    
+    def _load_prompts(self, path='config/prompts.json'):
+        # A prompt list, or a prompt matrix streamed lazily (see prompts.py)
+        return load_prompts(path)
+
+    def _iter_jobs(self, prompts, num_iterations, skip=frozenset(), shard=None):
+        """Yield one (provider, prompt, run_number) job per prompt x iteration x provider not in skip
+
+        With shard=(index, count) only the jobs assigned to that shard are yielded.
+        """
+        for prompt in prompts:
+            for iteration in range(1, num_iterations + 1):
+                for provider in self.providers:
+                    key = (provider.label, prompt, iteration)
+                    if key not in skip and (shard is None or in_shard(key, shard)):
+                        yield provider, prompt, iteration
+
+    def _open_journal(self, journal, resume):
+        """Return (journal, keys already done) for the journal argument of run_all_tests"""
+        if journal is None:
+            if resume:
+                raise ValueError("resume=True requires a journal to resume from")
+            return None, frozenset()
+        if not isinstance(journal, ResultJournal):
+            journal = ResultJournal(journal)
+        done = journal.completed_keys() if resume else frozenset()
+        if done:
+            print(f"Resuming from {journal.path}: {len(done)} calls already done")
+        return journal, done
+
+    def _recorder(self, journal, all_results):
+        """Function storing a result in the journal (or list) and counting it in self.telemetry"""
+        store = journal.append if journal else all_results.append
+
+        def record(result):
+            self.telemetry.record(result)
+            store(result)
+        return record
+
     def run_single_test(self, prompt, run_number=1):
         """Run a single prompt against all LLMs"""
         results = []
         
         # print(f"Testing prompt {run_number}: {prompt[:50]}...")
         
-       # Test each LLM
-        results.append(self.ask_openai(prompt, run_number))
-        time.sleep(1)  # Rate limiting
-        
-        results.append(self.ask_gemini(prompt, run_number))
-        time.sleep(1)
-        
-        results.append(self.ask_mistral(prompt, run_number))
-        time.sleep(1)
-        
-        results.append(self.ask_perplexity(prompt, run_number))
-        time.sleep(1)
+        # Test each LLM; pacing is handled by the per-provider rate limiters
+        for provider in self.providers:
+            results.append(self.ask(provider, prompt, run_number))
 
         return results
     
-    def run_all_tests(self, num_iterations=1):
-        """Run all prompts against all LLMs multiple times"""
+    def run_all_tests(self, num_iterations=1, concurrent=False, max_concurrency=8, journal=None, resume=False, prompts=None,
+                      shard=None):
+        """Run all prompts against all LLMs multiple times
+
+        With concurrent=True every prompt x iteration x provider call is
+        dispatched at once, capped at max_concurrency calls in flight.
+
+        With a journal (path or ResultJournal) each result is appended to disk
+        as soon as it comes back instead of being kept in memory, and the
+        journal itself is returned. resume=True skips the (model, prompt,
+        run_number) keys that already succeeded in that journal.
+
+        prompts (any iterable of prompt texts) defaults to config/prompts.json.
+
+        shard=(index, count) runs only that shard's share of the matrix (see
+        sharding.py), so count workers together make every call exactly once.
+        """
+        if concurrent:
+            return asyncio.run(self.run_all_tests_async(num_iterations, max_concurrency, journal, resume, prompts, shard))
+
+        journal, done = self._open_journal(journal, resume)
+
         # Load prompts
-        with open('config/prompts.json', 'r') as f:
-            prompts = json.load(f)
+        if prompts is None:
+            prompts = self._load_prompts()
         
         all_results = []
+        record = self._recorder(journal, all_results)
         
+        of_total = f"/{len(prompts)}" if hasattr(prompts, "__len__") else ""
+        if of_total and shard is None:
+            self.telemetry.expect(len(prompts) * num_iterations * len(self.providers) - len(done))
         for i, prompt in enumerate(prompts, 1):
-            print(f"\n=== Prompt {i}/{len(prompts)} ===")
+            print(f"\n=== Prompt {i}{of_total} ===")
             
             for iteration in range(1, num_iterations + 1):
                 print(f"Iteration {iteration}/{num_iterations}")
-                results = self.run_single_test(prompt, iteration)
-                all_results.extend(results)
+                for provider in self.providers:
+                    key = (provider.label, prompt, iteration)
+                    if key not in done and (shard is None or in_shard(key, shard)):
+                        record(self.ask(provider, prompt, iteration))
         
-        return all_results
-    
+        return journal if journal else all_results
+
+    async def run_all_tests_async(self, num_iterations=1, max_concurrency=8, journal=None, resume=False, prompts=None,
+                                  shard=None):
+        """Fan every prompt x iteration x provider call out concurrently
+
+        The SDK clients are blocking, so calls run on a thread pool sized to
+        max_concurrency. Jobs are pulled lazily by a fixed set of workers, so
+        at most max_concurrency calls are in flight at any time. Results are
+        returned (or journaled) in completion order.
+        """
+        journal, done = self._open_journal(journal, resume)
+        if prompts is None:
+            prompts = self._load_prompts()
+        if shard is not None:
+            print(f"Dispatching shard {shard[0]}/{shard[1]} with up to {max_concurrency} in flight...")
+        elif hasattr(prompts, "__len__"):
+            total = len(prompts) * num_iterations * len(self.providers) - len(done)
+            self.telemetry.expect(total)
+            print(f"Dispatching {total} calls with up to {max_concurrency} in flight...")
+        else:
+            # Prompts streamed from a matrix: jobs are generated as workers free up
+            print(f"Dispatching calls with up to {max_concurrency} in flight...")
+
+        all_results = []
+        record = self._recorder(journal, all_results)
+        jobs = self._iter_jobs(prompts, num_iterations, skip=done, shard=shard)
+        await self._run_jobs_async(jobs, record, max_concurrency)
+        return journal if journal else all_results
+
+    def run_all_tests_adaptive(self, target_width=0.3, min_runs=5, max_runs=20, confidence=0.95, budget=None,
+                               max_concurrency=8, journal=None, resume=False, prompts=None, shard=None):
+        """Sample each (model, prompt) cell until its Alan mention rate has converged
+
+        Every cell gets min_runs answers, then more runs go to the cells whose
+        Wilson interval (at `confidence`) is still wider than target_width,
+        widest first, until every cell has converged or made max_runs
+        attempts, or `budget` calls have been spent. Runs are dispatched in
+        waves on the concurrent path; each wave is planned from the answers
+        of the previous ones. With shard=(i, N), whole cells are sharded.
+
+        Journal and resume behave as in run_all_tests; on resume the
+        journal's rows count towards each cell's interval.
+        """
+        journal, _ = self._open_journal(journal, resume)
+        if prompts is None:
+            prompts = self._load_prompts()
+        providers = {provider.label: provider for provider in self.providers}
+        cells = [(label, prompt) for prompt in prompts for label in providers
+                 if shard is None or in_shard((label, prompt), shard)]
+
+        sampler = AdaptiveSampler(target_width, min_runs, max_runs, confidence, budget=budget)
+        if resume:
+            wanted = set(cells)
+            # Every attempt, errored ones included, counts towards max_runs
+            for result in journal.rows():
+                if (result.get("model"), result.get("prompt")) in wanted:
+                    sampler.record(result, spent=False)
+
+        all_results = []
+        record = self._recorder(journal, all_results)
+
+        def on_result(result):
+            sampler.record(result)
+            record(result)
+
+        wave_number = 0
+        while True:
+            wave = sampler.next_wave(cells, max_concurrency)
+            if not wave:
+                break
+            wave_number += 1
+            jobs = [
+                (providers[label], prompt, sampler.cell(label, prompt)["last_run"] + i)
+                for (label, prompt), runs in wave
+                for i in range(1, runs + 1)
+            ]
+            self.telemetry.expect(len(jobs))
+            print(f"Wave {wave_number}: {len(jobs)} calls on {len(wave)} open cells")
+            asyncio.run(self._run_jobs_async(jobs, on_result, max_concurrency))
+
+        self.sampler = sampler
+        summary = sampler.summary(cells)
+        print(f"Adaptive sampling: {summary['converged']}/{summary['cells']} cells converged, {summary['capped']} "
+              f"stopped at {max_runs} runs, {summary['open']} left open by the budget; {summary['calls']} calls "
+              f"instead of {summary['fixed_calls']}")
+        return journal if journal else all_results
+
+    def run_all_tests_batch(self, num_iterations=1, poll_interval=60, max_concurrency=8, journal=None, resume=False,
+                            prompts=None, shard=None):
+        """Run the sweep through provider batch APIs where available
+
+        The prompt x iteration matrix of every provider with a batch backend
+        (OpenAI, Mistral) is compiled into one batch job per provider and
+        submitted first; the other providers, and any whose batch backend
+        can't be built or take the job (e.g. no API key), go through the
+        concurrent live path while the batches run. Backends are only built
+        for providers with calls left after the cache. Batches are then polled every
+        poll_interval seconds and their outputs merged into ordinary result
+        rows. Cache, journal, resume and shard behave as in run_all_tests;
+        with a journal, each job id is recorded as soon as it is submitted
+        (ResultJournal.add_batch), so resume polls the jobs still open instead
+        of submitting their calls again.
+        """
+        journal, done = self._open_journal(journal, resume)
+        if prompts is None:
+            prompts = self._load_prompts()
+        all_results = []
+        record = self._recorder(journal, all_results)
+
+        # Backends (and their SDK clients) are only built for providers that need one
+        backends = {}
+
+        def backend_of(provider):
+            if provider not in backends:
+                try:
+                    backends[provider] = provider.batch_backend()
+                except Exception as e:
+                    print(f"Batch API unavailable for {provider.label} ({e}), running it live")
+                    backends[provider] = None
+            return backends[provider]
+
+        # Jobs submitted before an interruption are polled again rather than resubmitted
+        jobs = {}
+        if resume:
+            by_label = {provider.label: provider for provider in self.providers}
+            for job_id, (label, calls) in journal.open_batches().items():
+                calls = {custom_id: call for custom_id, call in calls.items() if (label, *call) not in done}
+                if label in by_label and calls and backend_of(by_label[label]) is not None:
+                    jobs[job_id] = (by_label[label], calls)
+                    print(f"Resuming batch {job_id} for {label}: {len(calls)} calls")
+        submitted = {(provider.label, *call) for provider, calls in jobs.values() for call in calls.values()}
+
+        # Split the matrix: cache hits and replay-only misses are recorded now,
+        # the remaining calls are batched where the provider has a batch API
+        pending = {}
+        live = []
+        matrix = list(self._iter_jobs(prompts, num_iterations, skip=done, shard=shard))
+        self.telemetry.expect(len(matrix))
+        for provider, prompt, run_number in matrix:
+            if (provider.label, prompt, run_number) in submitted:
+                continue
+            result = self._from_cache(provider, prompt, run_number)
+            if result is not None:
+                record(result)
+            else:
+                calls = pending.setdefault(provider, {})
+                calls[str(len(calls))] = (prompt, run_number)
+
+        for provider, calls in pending.items():
+            backend = backend_of(provider)
+            if backend is None:
+                live.extend((provider, prompt, run_number) for prompt, run_number in calls.values())
+                continue
+            requests = [{"custom_id": custom_id, "body": provider.batch_body(prompt)} for custom_id, (prompt, _) in calls.items()]
+            try:
+                job_id = backend.submit(requests)
+            except Exception as e:
+                # Can't batch right now: fall back to the live path for this provider
+                print(f"Batch submission failed for {provider.label} ({e}), running it live")
+                live.extend((provider, prompt, run_number) for prompt, run_number in calls.values())
+                continue
+            # Journaled before anything else, so an interrupted sweep resumes polling this job
+            if journal:
+                journal.add_batch(provider.label, job_id, calls)
+            jobs[job_id] = (provider, calls)
+            print(f"Submitted batch {job_id} for {provider.label}: {len(requests)} calls")
+
+        if live:
+            print(f"Running {len(live)} calls live with up to {max_concurrency} in flight...")
+            asyncio.run(self._run_jobs_async(live, record, max_concurrency))
+
+        failures = {}
+        while jobs:
+            for job_id, (provider, calls) in list(jobs.items()):
+                try:
+                    status = backends[provider].status(job_id)
+                    lines = None if status == RUNNING else list(backends[provider].results(job_id))
+                except Exception as e:
+                    # Network blips and 5xx: ask again at the next poll
+                    failures[job_id] = failures.get(job_id, 0) + 1
+                    print(f"Polling batch {job_id} for {provider.label} failed ({e})")
+                    if failures[job_id] < MAX_POLL_FAILURES:
+                        continue
+                    # Give up for this sweep: the calls are recorded as errors and the
+                    # job stays open in the journal, so resume polls it again
+                    for prompt, run_number in calls.values():
+                        record(provider.error_row(prompt, run_number, f"batch {job_id} unreachable: {e}"))
+                    del jobs[job_id]
+                    continue
+                failures.pop(job_id, None)
+                if lines is None:
+                    continue
+                print(f"Batch {job_id} for {provider.label} {status}")
+                self._merge_batch(provider, job_id, lines, calls, record)
+                if journal:
+                    journal.finish_batch(job_id)
+                del jobs[job_id]
+            if jobs:
+                time.sleep(poll_interval)
+
+        return journal if journal else all_results
+
+    def _merge_batch(self, provider, job_id, lines, calls, record):
+        """Turn a finished batch's output lines into result rows, one per submitted call"""
+        remaining = dict(calls)
+        for line in lines:
+            if line["custom_id"] not in remaining:
+                continue
+            prompt, run_number = remaining.pop(line["custom_id"])
+            if line["status_code"] == 200 and line["body"] is not None:
+                try:
+                    answer, extra = provider.parse_batch_body(line["body"])
+                    result = provider.success_row(prompt, run_number, answer, dict(extra, batch_id=job_id))
+                except Exception as e:
+                    result = provider.error_row(prompt, run_number, f"unparseable batch output: {e}")
+            else:
+                error = line["error"] or "no response body"
+                # Some backends' messages already carry the status
+                if line["status_code"] and not error.startswith("HTTP "):
+                    error = f"HTTP {line['status_code']}: {error}"
+                result = provider.error_row(prompt, run_number, error)
+            if self.cache and result["status"] == "success":
+                self.cache.put(self._cache_key(provider, prompt, run_number), result)
+            record(result)
+        for prompt, run_number in remaining.values():
+            record(provider.error_row(prompt, run_number, f"missing from batch {job_id} output"))
+
+    async def _run_jobs_async(self, jobs, on_result, max_concurrency):
+        """Run (provider, prompt, run_number) jobs on a bounded pool, passing each result to on_result
+
+        Each provider has its own lane. A job first waits for its provider's
+        rate limiter budget in the event loop, and only then for one of the
+        max_concurrency worker threads, so a throttled provider never holds
+        threads the other providers could use. The time spent in the lane is
+        added to the row's queue_seconds.
+        """
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        slots = asyncio.Semaphore(max_concurrency)
+        token_budget = self.stream_token_budget if self.stream else None
+        lanes = {}
+        for provider, prompt, run_number in jobs:
+            lanes.setdefault(provider, []).append((prompt, run_number))
+        running = set()
+        failures = []
+
+        async def in_slot(function, *args):
+            try:
+                return await loop.run_in_executor(executor, function, *args)
+            finally:
+                slots.release()
+
+        async def send(provider, prompt, run_number, queued_at):
+            waited = time.perf_counter() - queued_at
+            result = await in_slot(self._ask_uncached, provider, prompt, run_number, True)
+            if result.get("queue_seconds") is not None:
+                result = dict(result, queue_seconds=round(result["queue_seconds"] + waited, 4))
+            on_result(result)
+
+        def done(task):
+            running.discard(task)
+            if not task.cancelled() and task.exception():
+                failures.append(task.exception())
+
+        async def lane(provider, calls):
+            for prompt, run_number in calls:
+                if self.cache is not None:
+                    await slots.acquire()
+                    cached = await in_slot(self._from_cache, provider, prompt, run_number)
+                    if cached is not None:
+                        on_result(cached)
+                        continue
+                queued_at = time.perf_counter()
+                if provider.rate_limiter:
+                    await provider.rate_limiter.acquire_async(provider.estimate_tokens(prompt, token_budget))
+                # One slot waiter per lane: the lanes take turns for the threads
+                await slots.acquire()
+                task = asyncio.create_task(send(provider, prompt, run_number, queued_at))
+                running.add(task)
+                task.add_done_callback(done)
+
+        try:
+            await asyncio.gather(*(lane(provider, calls) for provider, calls in lanes.items()))
+            while running:
+                await asyncio.gather(*running, return_exceptions=True)
+        finally:
+            executor.shutdown(wait=True)
+        if failures:
+            raise failures[0]
+
     def save_to_csv(self, results, filename="results.csv"):
         """Save results to CSV"""
         if not results:
@@ -269,7 +530,7 @@ class LLMRunner:
         os.makedirs('data', exist_ok=True)
         filepath = f"data/{filename}"
         
-        fieldnames = ['model', 'prompt', 'alan_mentioned', 'response', 'run_number', 'timestamp',  'status', 'error']
+        fieldnames = ['model', 'prompt', 'alan_mentioned', 'brands_mentioned', 'response', 'run_number', 'timestamp',  'status', 'error']
         
         with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
@@ -278,29 +539,45 @@ class LLMRunner:
             for result in results:
                 # Fill in missing fields
                 row = {field: result.get(field, '') for field in fieldnames}
+                # Brands in order of first mention, e.g. "Alan; AXA"
+                if isinstance(row['brands_mentioned'], list):
+                    row['brands_mentioned'] = "; ".join(row['brands_mentioned'])
                 writer.writerow(row)
         
         print(f"\nResults saved to {filepath}")
 
+    def save_to_store(self, results, root='data/results', run_date=None, citation_index='data/citation_index.jsonl',
+                      run_index='data/run_index', sweep_id=None):
+        """Append results to the Parquet results store (partitioned by run date and model)
+
+        sweep_id (e.g. the journal's name) tells this sweep's rows from other
+        sweeps of the same day; only rows of the same sweep already stored are
+        skipped. Cited domains of the rows actually stored are added to the
+        CitationIndex at citation_index (a path or CitationIndex; None to skip)
+        in the same pass. The run date's summary in the RunIndex directory
+        run_index (None to skip) is then refreshed, so `python -m src diff`
+        compares runs without reloading them.
+        """
+        # pyarrow is only needed when results are persisted
+        from .results_store import ResultsStore
+        from .run_diff import RunIndex
+
+        run_date = str(run_date or date.today())
+        if citation_index is not None and not isinstance(citation_index, CitationIndex):
+            citation_index = CitationIndex(citation_index)
+
+        def on_write(result):
+            if citation_index is not None:
+                citation_index.add(result, run_date, sweep_id)
+
+        store = ResultsStore(root)
+        count, skipped = store.write(results, run_date=run_date, sweep_id=sweep_id, on_write=on_write)
+        print(f"\n{count} results saved to {root}" + (f" ({skipped} already stored for this sweep)" if skipped else ""))
+        if run_index is not None and count:
+            RunIndex(run_index, store).update(run_date, run_date)
+
 # Test script
 if __name__ == "__main__":
-    runner = LLMRunner()
-    
-    # Run all prompts for multiple iterations
-    with open('config/prompts.json', 'r') as f:
-        prompts = json.load(f)
-    
-    print(f"Running full test on {len(prompts)} prompts...")
-    results = runner.run_all_tests(num_iterations=1)
-    
-    # Show a brief summary of results
-    for result in results:
-        if result['status'] == 'success':
-            print(f"\n{result['model']} | run {result['run_number']}: Alan mentioned = {result['alan_mentioned']}")
-            print("Response:")
-            print(result['response'])
-        else:
-            print(f"\n{result['model']} | run {result['run_number']}: ERROR - {result.get('error', 'Unknown error')}")
-    
-    # Save aggregated results
-    runner.save_to_csv(results, "test_results.csv")
\ No newline at end of file
+    from .cli import main
+
+    main(["run", *sys.argv[1:]])
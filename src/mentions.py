@@ -0,0 +1,168 @@
+import json
+import re
+import threading
+import unicodedata
+
+
+def _build_fold_table():
+    """Map accented Latin letters to their bare form, one character to one
+
+    Keeping the text length unchanged means match offsets in the folded text
+    are also offsets in the original response.
+    """
+    table = {}
+    for code in range(0x80, 0x250):  # Latin-1 Supplement, Latin Extended-A/B
+        char = chr(code)
+        base = "".join(c for c in unicodedata.normalize("NFKD", char) if not unicodedata.combining(c))
+        if len(base) == 1 and base != char:
+            table[char] = base
+    # Typographic apostrophes and dashes LLMs like to emit
+    for code in (0x2018, 0x2019, 0x02BC):
+        table[chr(code)] = "'"
+    for code in range(0x2010, 0x2015):
+        table[chr(code)] = "-"
+    return table
+
+
+FOLD_TABLE = _build_fold_table()
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+_WORD_CHAR = re.compile(r"\w")
+
+
+def fold(text):
+    """Strip accents without changing the length of the text"""
+    if text.isascii():
+        return text
+    # Responses are mostly ASCII: substituting the few other characters is far
+    # cheaper than str.translate over the whole text
+    return _NON_ASCII.sub(lambda m: FOLD_TABLE.get(m.group(), m.group()), text)
+
+
+def _normalize_alias(alias):
+    return re.sub(r"[\s\-]+", " ", fold(alias).strip().lower())
+
+
+class MentionDetector:
+    """Find every brand of a dictionary in a response in a single regex pass
+
+    brands maps a canonical brand name to its aliases. All aliases are
+    compiled into one case-insensitive prefix-trie regex (the regex
+    equivalent of an Aho-Corasick automaton: each position is rejected after
+    a character or two) bounded by non-word characters, so "Alan" no longer
+    matches inside "Catalan" or "Alanis". Longer aliases win, e.g.
+    "Malakoff Humanis" over "Malakoff".
+    """
+
+    def __init__(self, brands):
+        self.brands = list(brands)
+        self.alias_to_brand = {}
+        for brand, aliases in brands.items():
+            for alias in [brand, *aliases]:
+                self.alias_to_brand[_normalize_alias(alias)] = brand
+
+        # No (?<!\w) in front: re then only tries positions holding the first
+        # letter of an alias, and the word boundary before a match is checked
+        # in _matches instead
+        trie = _trie_pattern(self.alias_to_brand)
+        self.pattern = re.compile(rf"{trie}(?!\w)")
+        # For the rare text whose length changes when lowercased (offsets would shift)
+        self.pattern_ignorecase = re.compile(rf"{trie}(?!\w)", re.IGNORECASE)
+
+    @staticmethod
+    def _matches(pattern, text):
+        """Matches of pattern in text that start a word"""
+        search = pattern.search
+        match = search(text)
+        while match:
+            start = match.start()
+            if start and _WORD_CHAR.match(text, start - 1):
+                # Inside a word ("Catalan"): a real mention may still start further on
+                match = search(text, start + 1)
+                continue
+            yield match
+            match = search(text, match.end())
+
+    def detect(self, text, partial=False):
+        """Brands in order of first mention, with first offsets and mention counts
+
+        partial=True is for text still streaming in: a match running to the
+        end of the text is ignored, since the next chunk may extend it
+        ("Alan" + "is").
+        """
+        offsets = {}
+        counts = {}
+        if text:
+            folded = fold(text)
+            lowered = folded.lower()
+            if len(lowered) == len(folded):
+                matches = self._matches(self.pattern, lowered)
+            else:
+                matches = self._matches(self.pattern_ignorecase, folded)
+            for match in matches:
+                if partial and match.end() == len(folded):
+                    continue
+                alias = match.group(0)
+                brand = self.alias_to_brand.get(alias) or self.alias_to_brand[_normalize_alias(alias)]
+                if brand not in offsets:
+                    offsets[brand] = match.start()
+                counts[brand] = counts.get(brand, 0) + 1
+        return {"brands": list(offsets), "offsets": offsets, "counts": counts}
+
+    def mention_fields(self, text):
+        """Result-row fields describing the brand mentions in text"""
+        found = self.detect(text)
+        return {
+            "alan_mentioned": "Alan" in found["offsets"],
+            "brands_mentioned": found["brands"],
+            "brand_offsets": found["offsets"],
+        }
+
+    def rescore(self, results):
+        """Recompute the mention fields of stored result rows, lazily"""
+        for result in results:
+            if result.get("status") == "success":
+                result = dict(result, **self.mention_fields(result.get("response") or ""))
+            yield result
+
+
+def _trie_pattern(aliases):
+    """Compile aliases into a regex trie: shared prefixes are matched once"""
+    trie = {}
+    for alias in aliases:
+        node = trie
+        for char in alias:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def render(node):
+        ends = "" in node
+        branches = []
+        for char in sorted(k for k in node if k):
+            # Spaces inside multi-word aliases match any run of spaces or hyphens
+            atom = r"[\s\-]+" if char == " " else re.escape(char)
+            branches.append(atom + render(node[char]))
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy optional group: the longest alias is tried first, the shorter one on backtrack
+        return f"(?:{body})?" if ends else body
+
+    return render(trie)
+
+
+def load_brand_dictionary(path='config/brands.json'):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+_default_detector = None
+_default_lock = threading.Lock()
+
+
+def default_detector():
+    """Detector for config/brands.json, compiled once per process"""
+    global _default_detector
+    with _default_lock:
+        if _default_detector is None:
+            _default_detector = MentionDetector(load_brand_dictionary())
+        return _default_detector
@@ -0,0 +1,187 @@
+"""Live view of a running sweep: a progress line and a Prometheus /metrics endpoint
+
+Both read the runner's Telemetry from a background thread, so they cost the
+sweep nothing but a lock per call. The progress line shows throughput over
+the last minute, calls in flight per model, errors and 429s so far, and the
+ETA when the number of calls is known:
+
+    [12m40s]  4210/16900 calls (24.9%)  5.5/s  in flight: gpt-5 6, sonar 2  errors 3  429s: sonar 41  ETA 38m27s
+
+The endpoint serves the same counters in the Prometheus text format on
+localhost only, e.g. for a Grafana panel during multi-hour sweeps:
+
+    python -m src run --iterations 20 --metrics-port 9108
+    curl localhost:9108/metrics
+"""
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Throughput is averaged over this many seconds, so the ETA follows slowdowns
+RATE_WINDOW = 60
+
+
+def _duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class Progress:
+    """Print a one-line status of the sweep every `interval` seconds, from a daemon thread"""
+
+    def __init__(self, telemetry, interval=10, stream=None):
+        self.telemetry = telemetry
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.samples = deque()
+        self.stopped = threading.Event()
+        self.started_at = time.monotonic()
+        self.thread = None
+
+    def line(self):
+        models = self.telemetry.snapshot()
+        now = time.monotonic()
+        done = sum(stats["calls"] + stats["cached"] for stats in models.values())
+        self.samples.append((now, done))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= RATE_WINDOW:
+            self.samples.popleft()
+        first_time, first_done = self.samples[0]
+        rate = (done - first_done) / (now - first_time) if now > first_time else 0.0
+
+        expected = self.telemetry.expected
+        parts = [f"[{_duration(now - self.started_at)}]"]
+        if expected:
+            parts.append(f"{done}/{expected} calls ({done / expected:.1%})")
+        else:
+            parts.append(f"{done} calls")
+        parts.append(f"{rate:.1f}/s")
+        by_model = sorted(models.items(), key=lambda item: str(item[0]))
+        in_flight = [f"{model} {stats['in_flight']}" for model, stats in by_model if stats["in_flight"]]
+        parts.append(f"in flight: {', '.join(in_flight) if in_flight else '0'}")
+        parts.append(f"errors {sum(stats['errors'] for stats in models.values())}")
+        throttled = [f"{model} {stats['rate_limited']}" for model, stats in by_model if stats["rate_limited"]]
+        parts.append(f"429s: {', '.join(throttled)}" if throttled else "429s 0")
+        if expected and rate > 0 and done < expected:
+            parts.append(f"ETA {_duration((expected - done) / rate)}")
+        return "  ".join(parts)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            print(self.line(), file=self.stream, flush=True)
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(target=self._run, name="progress", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# (metric, type, help, snapshot field) of the per-model series
+MODEL_METRICS = [
+    ("llm_calls_total", "counter", "Calls completed, cached answers excluded", "calls"),
+    ("llm_errors_total", "counter", "Calls that ended in an error", "errors"),
+    ("llm_cached_total", "counter", "Answers served from the response cache", "cached"),
+    ("llm_rate_limited_total", "counter", "429 responses retried", "rate_limited"),
+    ("llm_in_flight", "gauge", "Calls currently in flight", "in_flight"),
+    ("llm_input_tokens_total", "counter", "Input tokens billed", "input_tokens"),
+    ("llm_output_tokens_total", "counter", "Output tokens billed, reasoning included", "output_tokens"),
+    ("llm_reasoning_tokens_total", "counter", "Reasoning tokens billed", "reasoning_tokens"),
+    ("llm_web_search_calls_total", "counter", "Web searches made by the models", "web_search_calls"),
+    ("llm_cost_usd_total", "counter", "Estimated cost in USD", "cost_usd"),
+    ("llm_queue_seconds_total", "counter", "Time calls spent waiting on our rate limiters and worker threads", "queue_seconds"),
+]
+
+
+def render_metrics(telemetry):
+    """Telemetry counters in the Prometheus text exposition format"""
+    models = sorted(telemetry.snapshot().items(), key=lambda item: str(item[0]))
+    lines = [
+        "# HELP llm_sweep_expected_calls Calls the sweep is expected to make (0 if unknown)",
+        "# TYPE llm_sweep_expected_calls gauge",
+        f"llm_sweep_expected_calls {telemetry.expected}",
+    ]
+    for metric, kind, description, name in MODEL_METRICS:
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{model="{_label(model)}"}} {stats[name]}' for model, stats in models]
+    lines += ["# HELP llm_latency_seconds Latency of completed calls, retries included, rate limiter waits excluded",
+              "# TYPE llm_latency_seconds summary"]
+    for model, stats in models:
+        for quantile, name in (("0.5", "latency_p50"), ("0.95", "latency_p95")):
+            if stats[name] is not None:
+                lines.append(f'llm_latency_seconds{{model="{_label(model)}",quantile="{quantile}"}} {stats[name]}')
+        lines.append(f'llm_latency_seconds_sum{{model="{_label(model)}"}} {stats["latency_sum"]}')
+        lines.append(f'llm_latency_seconds_count{{model="{_label(model)}"}} {stats["latency_count"]}')
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serve render_metrics(telemetry) at http://host:port/metrics from a daemon thread"""
+
+    def __init__(self, telemetry, port, host='127.0.0.1'):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render_metrics(telemetry).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+        host, port = self.server.server_address[:2]
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Monitor:
+    """Context manager running the progress line and/or metrics endpoint for the duration of a sweep
+
+    interval=0 turns the progress line off; port=None the endpoint.
+    """
+
+    def __init__(self, telemetry, interval=10, port=None):
+        self.parts = []
+        if interval:
+            self.parts.append(Progress(telemetry, interval))
+        if port is not None:
+            self.parts.append(MetricsServer(telemetry, port))
+
+    def __enter__(self):
+        for part in self.parts:
+            part.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for part in self.parts:
+            part.stop()
@@ -0,0 +1,161 @@
+"""Prompt lists and the prompt matrix
+
+config/prompt_matrix.json describes prompts as templates x personas x
+company sizes x languages instead of a hand-written list:
+
+    {
+      "languages": ["fr", "en"],
+      "personas": {"founder": {"fr": "fondateur de start-up", "en": "a startup founder"}},
+      "sizes": {"startup": {"fr": "une start-up de 25 personnes", "en": "a 25-person startup"}},
+      "templates": [
+        {"id": "best", "text": {"fr": "Je suis {persona}. Quelle mutuelle pour {size} ?",
+                                "en": "I'm {persona}. What's the best health insurance for {size}?"}}
+      ]
+    }
+
+A template is expanded over the dimensions its text uses ({persona},
+{size}), in each of its languages listed in "languages". Prompts are
+generated lazily and near-identical ones (same text up to case, accents,
+punctuation and spacing) are dropped. Every prompt's id is derived from that
+normalized text, so it is stable across runs and config edits:
+
+    python -m src prompts --matrix config/prompt_matrix.json
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import re
+import string
+
+from .mentions import fold
+
+# Placeholder -> dimension of the matrix it is filled from
+DIMENSIONS = {"persona": "personas", "size": "sizes"}
+
+
+def normalize_prompt(text):
+    """Text with case, accents, punctuation and spacing differences removed"""
+    return " ".join(re.findall(r"\w+", fold(text).casefold()))
+
+
+def prompt_id(text):
+    """Stable id of a prompt: near-identical texts share it"""
+    return "p-" + hashlib.sha1(normalize_prompt(text).encode("utf-8")).hexdigest()[:12]
+
+
+def _placeholders(text):
+    return {field for _, field, _, _ in string.Formatter().parse(text) if field is not None}
+
+
+class PromptMatrix:
+    """Templates x personas x company sizes x languages, expanded on demand"""
+
+    def __init__(self, templates, personas=None, sizes=None, languages=None):
+        self.templates = templates
+        self.dimensions = {"personas": personas or {}, "sizes": sizes or {}}
+        self.languages = languages
+        self.validate()
+
+    @classmethod
+    def load(cls, path='config/prompt_matrix.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config["templates"], config.get("personas"), config.get("sizes"), config.get("languages"))
+
+    def validate(self):
+        """Raise ValueError listing every template that can't be expanded"""
+        problems = []
+        ids = set()
+        for position, template in enumerate(self.templates, 1):
+            name = template.get("id") or f"#{position}"
+            if not template.get("id"):
+                problems.append(f"template {name}: missing id")
+            elif template["id"] in ids:
+                problems.append(f"template {name}: duplicate id")
+            ids.add(template.get("id"))
+            texts = template.get("text")
+            if not isinstance(texts, dict) or not texts:
+                problems.append(f"template {name}: text must map languages to template strings")
+                continue
+            for language, text in texts.items():
+                if not text or not text.strip():
+                    problems.append(f"template {name} [{language}]: empty text")
+                    continue
+                try:
+                    fields = _placeholders(text)
+                except ValueError as e:
+                    problems.append(f"template {name} [{language}]: {e}")
+                    continue
+                for field in sorted(fields):
+                    if field not in DIMENSIONS:
+                        problems.append(f"template {name} [{language}]: unknown placeholder {{{field}}}")
+                        continue
+                    values = self.dimensions[DIMENSIONS[field]]
+                    if not values:
+                        problems.append(f"template {name} [{language}]: no {DIMENSIONS[field]} defined")
+                    missing = sorted(key for key, variants in values.items() if not variants.get(language))
+                    if missing:
+                        problems.append(f"template {name} [{language}]: {DIMENSIONS[field]} without a "
+                                        f"{language} variant: {', '.join(missing)}")
+        if problems:
+            raise ValueError("Invalid prompt matrix:\n  " + "\n  ".join(problems))
+
+    def __iter__(self):
+        """Yield prompt records ({id, text, language, template, persona, size}), deduplicated"""
+        seen = set()
+        for template in self.templates:
+            for language, text in template["text"].items():
+                if self.languages and language not in self.languages:
+                    continue
+                fields = sorted(_placeholders(text))
+                choices = [self.dimensions[DIMENSIONS[field]] for field in fields]
+                for combination in itertools.product(*choices):
+                    values = {field: choices[i][key][language] for i, (field, key) in enumerate(zip(fields, combination))}
+                    prompt = " ".join(text.format(**values).split())
+                    record = {"id": prompt_id(prompt), "text": prompt, "language": language,
+                              "template": template["id"], **dict.fromkeys(DIMENSIONS), **dict(zip(fields, combination))}
+                    if record["id"] not in seen:
+                        seen.add(record["id"])
+                        yield record
+
+    def texts(self):
+        """Prompt texts only, lazily"""
+        return (record["text"] for record in self)
+
+
+def unique_prompts(prompts):
+    """Drop near-identical prompts from a list, keeping the first"""
+    seen = set()
+    for prompt in prompts:
+        key = prompt_id(prompt)
+        if key not in seen:
+            seen.add(key)
+            yield prompt
+
+
+def load_prompts(path='config/prompts.json'):
+    """Prompt texts of a prompt file: a JSON list of prompts, or a prompt matrix (expanded lazily)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    if isinstance(config, list):
+        return list(unique_prompts(config))
+    return PromptMatrix(config["templates"], config.get("personas"), config.get("sizes"), config.get("languages")).texts()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Expand and check a prompt matrix")
+    parser.add_argument("--matrix", default='config/prompt_matrix.json')
+    parser.add_argument("--count", action="store_true", help="only print the number of prompts per language")
+    args = parser.parse_args(argv)
+
+    counts = {}
+    for record in PromptMatrix.load(args.matrix):
+        counts[record["language"]] = counts.get(record["language"], 0) + 1
+        if not args.count:
+            print(f"{record['id']}  {record['language']}  {record['template']:<16} {record['text']}")
+    print(f"{sum(counts.values())} prompts ({', '.join(f'{n} {language}' for language, n in counts.items())})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,610 @@
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from .batch import FakeBatchBackend, MistralBatchBackend, OpenAIBatchBackend
+from .citations import extract_openai, extract_perplexity
+from .mentions import default_detector
+from .prompts import prompt_id
+from .rate_limiter import RateLimitError, call_with_retry, estimate_tokens
+from .telemetry import call_cost, chat_usage, gemini_usage, openai_usage, usage_fields
+
+# name -> Provider subclass, filled by @register_provider
+PROVIDERS = {}
+
+
+def register_provider(name):
+    """Class decorator making a Provider selectable by name in config/models.json"""
+    def decorator(cls):
+        cls.name = name
+        PROVIDERS[name] = cls
+        return cls
+    return decorator
+
+
+def create_provider(name, **options):
+    """Instantiate a registered provider by name"""
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown provider {name!r}, expected one of: {', '.join(sorted(PROVIDERS))}")
+    return PROVIDERS[name](**options)
+
+
+def load_model_config(path='config/models.json'):
+    """List of model entries ({"provider": ..., **options}) to run"""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def model_label(entry):
+    """Label a model config entry will get, without instantiating its provider"""
+    cls = PROVIDERS[entry["provider"]]
+    return entry.get("label") or cls.default_label or entry.get("model") or cls.default_settings["model"]
+
+
+def select_models(entries, names):
+    """Keep the entries whose label or provider name is in names"""
+    names = set(names)
+    selected = [entry for entry in entries if model_label(entry) in names or entry["provider"] in names]
+    unknown = names - {model_label(entry) for entry in selected} - {entry["provider"] for entry in selected}
+    if unknown:
+        raise ValueError(f"No configured model matches: {', '.join(sorted(unknown))}")
+    return selected
+
+
+class Provider:
+    """One LLM backend. Subclasses implement complete(prompt) -> (answer, extra fields)
+
+    `settings` are the request parameters (model, temperature, max_tokens,
+    system_prompt, tools); they are what the response cache hashes. `label`
+    is the model name written into result rows.
+
+    SDKs are imported and clients built by make_client() on first use of
+    `client`, so constructing a provider is free and a cache-only run never
+    loads them.
+
+    complete() reports token usage as USAGE_FIELDS in its extra fields (see
+    telemetry.py); rows are priced with this model's entry of `prices`.
+    """
+
+    name = None
+    default_label = None
+    # Extra fields added to every successful row (complete() can add more)
+    row_fields = {}
+    default_settings = {"model": None, "temperature": None, "max_tokens": None, "system_prompt": None, "tools": None}
+    # Constructor options (attribute names) that change the answers, so they are part of the cache key
+    answer_options = ()
+
+    def __init__(self, label=None, rate_limiter=None, prices=None, **settings):
+        unknown = set(settings) - set(self.default_settings)
+        if unknown:
+            raise TypeError(f"{type(self).__name__} got unknown settings: {', '.join(sorted(unknown))}")
+        self.settings = dict(self.default_settings, **settings)
+        self.label = label or self.default_label or self.settings["model"]
+        self.rate_limiter = rate_limiter
+        prices = prices or {}
+        self.price = prices.get(self.settings["model"]) or prices.get(self.label)
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self.make_client()
+        return self._client
+
+    def make_client(self):
+        return None
+
+    def cache_fields(self):
+        """Everything that determines the answer, besides the prompt and run number
+
+        The label is included: two entries of the same provider and settings
+        are still different models of the sweep, each with its own answers.
+        """
+        options = {name: getattr(self, name) for name in self.answer_options}
+        return dict(self.settings, **options, provider=self.name, label=self.label)
+
+    def complete(self, prompt):
+        raise NotImplementedError
+
+    def stream(self, prompt):
+        """Yield the answer as text chunks; providers without a streaming API yield it whole
+
+        A dict yielded among the chunks holds extra row fields (usage,
+        citations), usually sent with the last event of the stream.
+        """
+        answer, extra = self.complete(prompt)
+        yield answer
+        yield extra
+
+    def _call(self, call, prompt, run_number, estimated_tokens, on_retry=None, in_flight=None, acquired=False):
+        """Run call() -> (answer, extra) with retries, timing it, and return a result row
+
+        latency_seconds sums the call() attempts only; the time spent waiting
+        on the rate limiter (pacing, 429 pauses and backoff) goes to
+        queue_seconds, so our own pacing isn't blamed on the provider.
+        on_retry(error, delay) is called before each 429 retry, e.g. to count
+        them live while the call is still in flight; in_flight() returns a
+        context manager entered around each attempt actually sent.
+        acquired=True when the caller already took the first attempt's limiter
+        budget (see LLMRunner._run_jobs_async).
+        """
+        retries = 0
+        attempts_seconds = 0.0
+
+        def count_retry(error, delay):
+            nonlocal retries
+            retries += 1
+            if on_retry:
+                on_retry(error, delay)
+
+        def attempt():
+            nonlocal attempts_seconds
+            with in_flight() if in_flight else contextlib.nullcontext():
+                started = time.perf_counter()
+                try:
+                    return call()
+                finally:
+                    attempts_seconds += time.perf_counter() - started
+
+        start = time.perf_counter()
+
+        def timing():
+            return {"latency_seconds": round(attempts_seconds, 4),
+                    "queue_seconds": round(time.perf_counter() - start - attempts_seconds, 4), "retries": retries}
+
+        try:
+            answer, extra = call_with_retry(attempt, self.rate_limiter, estimated_tokens, on_retry=count_retry,
+                                            acquired=acquired)
+        except Exception as e:
+            return dict(self.error_row(prompt, run_number, str(e)), **timing())
+        return self.success_row(prompt, run_number, answer, dict(extra, **timing()))
+
+    def estimate_tokens(self, prompt, token_budget=None):
+        """Tokens the rate limiter charges for one call (token_budget: a streaming cap)"""
+        return estimate_tokens(prompt, token_budget or self.settings["max_tokens"])
+
+    def ask(self, prompt, run_number, on_retry=None, in_flight=None, acquired=False):
+        """Call the model under its rate limiter and return a result row"""
+        return self._call(lambda: self.complete(prompt), prompt, run_number, self.estimate_tokens(prompt), on_retry,
+                          in_flight, acquired)
+
+    def ask_stream(self, prompt, run_number, should_stop=None, token_budget=None, on_retry=None, in_flight=None,
+                   acquired=False):
+        """Like ask(), but consume the answer through the streaming API
+
+        Records time to first token and total generation time. The stream is
+        cancelled early once should_stop(text_so_far) is true or roughly
+        token_budget output tokens have arrived; the row then holds the
+        partial answer and says why it stopped in stream_stop_reason.
+        """
+        def consume():
+            start = time.perf_counter()
+            first_token = None
+            stop_reason = None
+            text = ""
+            extra = {}
+            chunks = self.stream(prompt)
+            try:
+                for chunk in chunks:
+                    if isinstance(chunk, dict):
+                        extra.update(chunk)
+                        continue
+                    if not chunk:
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    text += chunk
+                    if should_stop and should_stop(text):
+                        stop_reason = "detection_complete"
+                        break
+                    if token_budget and len(text) // 4 >= token_budget:
+                        stop_reason = "token_budget"
+                        break
+            finally:
+                # Closing the generator closes the underlying HTTP stream
+                chunks.close()
+            end = time.perf_counter()
+            return text, dict(
+                extra,
+                ttft_seconds=round(first_token - start, 4) if first_token else None,
+                generation_seconds=round(end - start, 4),
+                stream_stop_reason=stop_reason,
+            )
+
+        return self._call(consume, prompt, run_number, self.estimate_tokens(prompt, token_budget), on_retry, in_flight,
+                          acquired)
+
+    def batch_backend(self):
+        """BatchBackend for this provider's batch API, or None to use the live path"""
+        return None
+
+    def batch_body(self, prompt):
+        """Request body of one batch line"""
+        raise NotImplementedError
+
+    def parse_batch_body(self, body):
+        """(answer, extra fields) from the response body of one batch line"""
+        raise NotImplementedError
+
+    def success_row(self, prompt, run_number, answer, extra):
+        if "input_tokens" in extra:
+            extra = dict(extra, cost_usd=call_cost(self.price, extra))
+        return {
+            "model": self.label,
+            "prompt": prompt,
+            "prompt_id": prompt_id(prompt),
+            "response": answer,
+            "run_number": run_number,
+            "timestamp": datetime.now().isoformat(),
+            **default_detector().mention_fields(answer or ""),
+            **self.row_fields,
+            **extra,
+            "status": "success"
+        }
+
+    def error_row(self, prompt, run_number, error):
+        return {"model": self.label, "prompt": prompt, "prompt_id": prompt_id(prompt), "error": error, "status": "error",
+                "run_number": run_number}
+
+
+@register_provider("openai")
+class OpenAIProvider(Provider):
+    """OpenAI via Responses API with web search; url_citation annotations become citation records"""
+
+    default_settings = dict(
+        Provider.default_settings,
+        model="gpt-5",
+        system_prompt="You are a helpful assistant. Cite your sources when possible.",
+        tools=[{"type": "web_search"}],
+    )
+
+    def make_client(self):
+        from openai import OpenAI
+
+        # No SDK retries: 429s must reach call_with_retry, which honours Retry-After across callers and counts them
+        return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+    def request(self, prompt):
+        """Responses API parameters; temperature and max_output_tokens only when set
+
+        Reasoning models such as gpt-5 reject temperature, so it is left out by default.
+        """
+        body = {
+            "model": self.settings["model"],
+            "input": [
+                {"role": "system", "content": self.settings["system_prompt"]},
+                {"role": "user", "content": prompt}
+            ],
+            "tools": self.settings["tools"],
+        }
+        if self.settings["temperature"] is not None:
+            body["temperature"] = self.settings["temperature"]
+        if self.settings["max_tokens"] is not None:
+            body["max_output_tokens"] = self.settings["max_tokens"]
+        return body
+
+    def complete(self, prompt):
+        response = self.client.responses.create(**self.request(prompt))
+
+        answer, citations = extract_openai(response.output)
+        return answer, dict(openai_usage(response), citations=citations)
+
+    def batch_backend(self):
+        return OpenAIBatchBackend(self.client)
+
+    def batch_body(self, prompt):
+        return self.request(prompt)
+
+    def parse_batch_body(self, body):
+        # Raw Responses API JSON, same shape as the SDK objects
+        answer, citations = extract_openai(body.get("output"))
+        return answer, dict(openai_usage(body), citations=citations)
+
+    def stream(self, prompt):
+        events = self.client.responses.create(**self.request(prompt), stream=True)
+        try:
+            for event in events:
+                event_type = getattr(event, "type", None)
+                if event_type == "response.output_text.delta":
+                    yield event.delta
+                elif event_type == "response.completed":
+                    _, citations = extract_openai(event.response.output)
+                    yield dict(openai_usage(event.response), citations=citations)
+        finally:
+            events.close()
+
+
+@register_provider("gemini")
+class GeminiProvider(Provider):
+    """Google Gemini"""
+
+    default_settings = dict(Provider.default_settings, model="gemini-2.5-flash")
+
+    def make_client(self):
+        # google.generativeai alone takes the better part of a second to import
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        return genai.GenerativeModel(self.settings["model"], system_instruction=self.settings["system_prompt"])
+
+    def generation_config(self):
+        """temperature and max_output_tokens, only when set"""
+        config = {}
+        if self.settings["temperature"] is not None:
+            config["temperature"] = self.settings["temperature"]
+        if self.settings["max_tokens"] is not None:
+            config["max_output_tokens"] = self.settings["max_tokens"]
+        return config
+
+    def complete(self, prompt):
+        response = self.client.generate_content(prompt, generation_config=self.generation_config())
+        return response.text, gemini_usage(response)
+
+    def stream(self, prompt):
+        # Every chunk carries the usage so far; the last one is the total
+        chunk = None
+        for chunk in self.client.generate_content(prompt, generation_config=self.generation_config(), stream=True):
+            yield chunk.text
+        if chunk is not None:
+            yield gemini_usage(chunk)
+
+
+@register_provider("mistral")
+class MistralProvider(Provider):
+    """Mistral"""
+
+    default_settings = dict(Provider.default_settings, model="mistral-medium-2508", temperature=0.7, max_tokens=500)
+
+    def make_client(self):
+        from mistralai.sdk import Mistral
+        from mistralai.utils import RetryConfig
+
+        # No SDK retries (see OpenAIProvider.make_client)
+        return Mistral(api_key=os.getenv("MISTRAL_API_KEY"), retry_config=RetryConfig("none", None, False))
+
+    def complete(self, prompt):
+        messages = [{"role": "user", "content": prompt}]
+        response = self.client.chat.complete(
+            model=self.settings["model"],
+            messages=messages,
+            max_tokens=self.settings["max_tokens"],
+            temperature=self.settings["temperature"]
+        )
+        return response.choices[0].message.content, chat_usage(response.usage)
+
+    def batch_backend(self):
+        return MistralBatchBackend(self.client, self.settings["model"])
+
+    def batch_body(self, prompt):
+        # The model is set on the batch job, not per line
+        return {
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": self.settings["max_tokens"],
+            "temperature": self.settings["temperature"],
+        }
+
+    def parse_batch_body(self, body):
+        return body["choices"][0]["message"]["content"], chat_usage(body.get("usage"))
+
+    def stream(self, prompt):
+        messages = [{"role": "user", "content": prompt}]
+        with self.client.chat.stream(
+            model=self.settings["model"],
+            messages=messages,
+            max_tokens=self.settings["max_tokens"],
+            temperature=self.settings["temperature"]
+        ) as events:
+            for event in events:
+                choices = event.data.choices
+                if choices and choices[0].delta.content:
+                    yield choices[0].delta.content
+                if event.data.usage:
+                    yield chat_usage(event.data.usage)
+
+
+@register_provider("perplexity")
+class PerplexityProvider(Provider):
+    """Perplexity (web-connected search model), with its search results as citation records
+
+    Calls share one keep-alive requests.Session, so connections (and their
+    TLS handshakes) are reused across the sweep. pool_size should be at least
+    the number of concurrent Perplexity calls. Connection errors and 5xx
+    answers are retried with backoff by the transport; 429s are left to the
+    rate limiter. Every request has a connect and a read timeout.
+    """
+
+    default_label = "perplexity-sonar"
+    default_settings = dict(Provider.default_settings, model="sonar", temperature=0.7, max_tokens=500)
+    row_fields = {"web_connected": True}
+    url = "https://api.perplexity.ai/chat/completions"
+
+    def __init__(self, pool_size=16, connect_timeout=5.0, read_timeout=120.0, max_retries=3, backoff_factor=0.5,
+                 **options):
+        super().__init__(**options)
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+    def make_client(self):
+        # Perplexity doesn't need a special client, just a requests session
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            # Chat completions have no side effects, so POSTs are safe to retry
+            allowed_methods=frozenset(["POST"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.headers.update({
+            "Authorization": f"Bearer {os.getenv('PERPLEXITY_API_KEY')}",
+            "Content-Type": "application/json"
+        })
+        return session
+
+    def _post(self, prompt, stream=False):
+        data = {
+            "model": self.settings["model"],
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": self.settings["max_tokens"],
+            "temperature": self.settings["temperature"]
+        }
+        if stream:
+            data["stream"] = True
+
+        response = self.client.post(self.url, json=data, stream=stream, timeout=self.timeout)
+        if self.rate_limiter:
+            self.rate_limiter.update_from_headers(response.headers)
+        if response.status_code == 429:
+            raise RateLimitError(f"HTTP 429: {response.text}", retry_after=response.headers.get("retry-after"))
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text}")
+        return response
+
+    def complete(self, prompt):
+        result = self._post(prompt).json()
+        return result['choices'][0]['message']['content'], dict(chat_usage(result.get("usage")),
+                                                                  citations=extract_perplexity(result))
+
+    def stream(self, prompt):
+        # Server-sent events: "data: {json chunk}" lines, terminated by "data: [DONE]"
+        response = self._post(prompt, stream=True)
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                choices = chunk.get("choices") or []
+                if choices:
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        yield content
+                # Usage and sources come with the final chunks
+                if chunk.get("usage"):
+                    yield dict(chat_usage(chunk["usage"]), citations=extract_perplexity(chunk))
+        finally:
+            response.close()
+
+
+@register_provider("mock")
+class MockProvider(Provider):
+    """Deterministic in-process stand-in for offline runs and benchmarks
+
+    Simulates latency (latency +/- latency_jitter seconds), random failures
+    (error_rate), random 429s (rate_limit_rate) and a server-side quota
+    (quota_per_minute, answering 429 with a Retry-After once exceeded). The
+    same seed, prompt and call order always give the same answers. With
+    batch_delay set it also offers a fake batch endpoint whose jobs complete
+    after that many seconds.
+    """
+
+    default_settings = dict(Provider.default_settings, model="mock-llm")
+    answer_options = ("latency", "latency_jitter", "error_rate", "rate_limit_rate", "retry_after", "quota_per_minute",
+                      "mention_rate", "seed", "batch_delay")
+    brands = ["Alan", "Malakoff Humanis", "Swile", "Hiscox", "DKV", "AXA", "Allianz", "Harmonie Mutuelle"]
+
+    def __init__(self, latency=0.5, latency_jitter=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1.0, quota_per_minute=None, mention_rate=0.5, seed=0, batch_delay=None, **options):
+        super().__init__(**options)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.quota_per_minute = quota_per_minute
+        self.mention_rate = mention_rate
+        self.seed = seed
+        self.batch_delay = batch_delay
+        self.call_counts = {}
+        self.recent_calls = deque()
+        self.lock = threading.Lock()
+
+    def _check_quota(self):
+        if not self.quota_per_minute:
+            return
+        with self.lock:
+            now = time.monotonic()
+            while self.recent_calls and now - self.recent_calls[0] >= 60:
+                self.recent_calls.popleft()
+            if len(self.recent_calls) >= self.quota_per_minute:
+                raise RateLimitError("HTTP 429: mock quota exceeded", retry_after=60 - (now - self.recent_calls[0]))
+            self.recent_calls.append(now)
+
+    def _start_call(self, prompt):
+        """Draw this call's random stream, quota and injected 429, and its latency"""
+        with self.lock:
+            count = self.call_counts.get(prompt, 0) + 1
+            self.call_counts[prompt] = count
+        rng = random.Random(f"{self.seed}|{self.label}|{prompt}|{count}")
+
+        self._check_quota()
+        if rng.random() < self.rate_limit_rate:
+            raise RateLimitError("HTTP 429: injected by mock provider", retry_after=self.retry_after)
+        return rng, max(0.0, self.latency + rng.uniform(-self.latency_jitter, self.latency_jitter))
+
+    def complete(self, prompt):
+        rng, latency = self._start_call(prompt)
+        time.sleep(latency)
+        answer = self._answer(rng)
+        return answer, self._usage(prompt, answer)
+
+    def stream(self, prompt):
+        # A third of the latency before the first token, the rest spread over the lines
+        rng, latency = self._start_call(prompt)
+        time.sleep(latency / 3)
+        answer = self._answer(rng)
+        lines = answer.splitlines(keepends=True)
+        for line in lines:
+            yield line
+            time.sleep(latency * 2 / 3 / len(lines))
+        yield self._usage(prompt, answer)
+
+    def batch_backend(self):
+        if self.batch_delay is None:
+            return None
+        return FakeBatchBackend(self._respond_batch, delay=self.batch_delay)
+
+    def batch_body(self, prompt):
+        return {"prompt": prompt}
+
+    def parse_batch_body(self, body):
+        return body["answer"], body["usage"]
+
+    def _respond_batch(self, body):
+        rng, _ = self._start_call(body["prompt"])
+        answer = self._answer(rng)
+        return {"answer": answer, "usage": self._usage(body["prompt"], answer)}
+
+    def _usage(self, prompt, answer):
+        # ~4 characters per token, like estimate_tokens()
+        return usage_fields(len(prompt) // 4, len(answer) // 4, 0, 0)
+
+    def _answer(self, rng):
+        if rng.random() < self.error_rate:
+            raise RuntimeError("HTTP 500: injected by mock provider")
+
+        brands = [b for b in self.brands[1:] if rng.random() < 0.4]
+        if rng.random() < self.mention_rate:
+            brands.insert(rng.randrange(len(brands) + 1), "Alan")
+        if not brands:
+            return "There is no single best option; compare several insurers before choosing."
+        lines = [f"{i}. {brand}" for i, brand in enumerate(brands, 1)]
+        return "Here are some options worth comparing:\n" + "\n".join(lines)
@@ -0,0 +1,246 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+# Default quotas per provider (requests/min, tokens/min). Override them in
+# config/rate_limits.json to match the tier of each API key.
+DEFAULT_RATE_LIMITS = {
+    "openai": {"requests_per_minute": 500, "tokens_per_minute": 200000},
+    "gemini": {"requests_per_minute": 1000, "tokens_per_minute": 1000000},
+    "mistral": {"requests_per_minute": 300, "tokens_per_minute": 500000},
+    "perplexity": {"requests_per_minute": 50, "tokens_per_minute": None},
+}
+
+
+class RateLimitError(Exception):
+    """Raised when a provider answers 429; carries the server's Retry-After if any"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = _parse_duration(retry_after)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute"""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.refill_per_second = rate_per_minute / 60.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def try_acquire(self, amount=1):
+        """Take `amount` tokens if available and return 0, else the seconds to wait before trying again"""
+        # A single request larger than the bucket would never fit; cap it so it
+        # waits for a full bucket instead of blocking forever.
+        amount = min(amount, self.capacity)
+        with self.lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.refill_per_second
+
+    def acquire(self, amount=1):
+        """Block until `amount` tokens are available, then take them"""
+        while True:
+            wait = self.try_acquire(amount)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, amount=1):
+        """acquire() for the event loop: waiting holds no thread"""
+        while True:
+            wait = self.try_acquire(amount)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def drain(self):
+        """Empty the bucket, e.g. when the server says the quota is exhausted"""
+        with self.lock:
+            self._refill()
+            self.tokens = 0.0
+
+
+class ProviderRateLimiter:
+    """Requests/min and tokens/min limits for one provider, plus server-imposed pauses"""
+
+    def __init__(self, name, requests_per_minute=None, tokens_per_minute=None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _pause_left(self):
+        with self.lock:
+            return self.paused_until - time.monotonic()
+
+    def acquire(self, estimated_tokens=0):
+        """Wait for any server-imposed pause, then for request and token budget"""
+        while (wait := self._pause_left()) > 0:
+            time.sleep(wait)
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens and estimated_tokens:
+            self.tokens.acquire(estimated_tokens)
+
+    async def acquire_async(self, estimated_tokens=0):
+        """acquire() for the event loop, so a throttled provider's queue holds no worker thread"""
+        while (wait := self._pause_left()) > 0:
+            await asyncio.sleep(wait)
+        if self.requests:
+            await self.requests.acquire_async(1)
+        if self.tokens and estimated_tokens:
+            await self.tokens.acquire_async(estimated_tokens)
+
+    def pause(self, seconds):
+        """Hold back every caller of this provider for `seconds`"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """Pause until the reset time when the rate-limit headers report an exhausted quota"""
+        if not headers:
+            return
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            remaining = _parse_number(headers.get(f"x-ratelimit-remaining-{kind}"))
+            if remaining is not None and remaining <= 0:
+                reset = _parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if bucket:
+                    bucket.drain()
+                if reset:
+                    self.pause(reset)
+
+
+def load_rate_limits(path='config/rate_limits.json'):
+    """Merge config/rate_limits.json (if present) over the defaults"""
+    limits = {name: dict(values) for name, values in DEFAULT_RATE_LIMITS.items()}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            for name, values in json.load(f).items():
+                limits.setdefault(name, {}).update(values)
+    return limits
+
+
+def build_rate_limiters(limits=None):
+    """One ProviderRateLimiter per configured provider"""
+    if limits is None:
+        limits = load_rate_limits()
+    return {
+        name: ProviderRateLimiter(name, values.get("requests_per_minute"), values.get("tokens_per_minute"))
+        for name, values in limits.items()
+    }
+
+
+def estimate_tokens(prompt, max_tokens=None):
+    """Rough prompt + completion token estimate (~4 characters per token)"""
+    return len(prompt) // 4 + (max_tokens or 500)
+
+
+def _parse_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_duration(value):
+    """Parse '20', '1.5s', '250ms' or '1m30s' style reset headers into seconds"""
+    if value is None:
+        return None
+    number = _parse_number(value)
+    if number is not None:
+        return number
+    total, digits = 0.0, ""
+    text = str(value).strip().lower()
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char.isdigit() or char == ".":
+            digits += char
+        elif text.startswith("ms", i):
+            total += float(digits or 0) / 1000
+            digits = ""
+            i += 1
+        elif char in "hms":
+            total += float(digits or 0) * {"h": 3600, "m": 60, "s": 1}[char]
+            digits = ""
+        else:
+            return None
+        i += 1
+    return total
+
+
+def _response_headers(exc):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or getattr(exc, "headers", None)
+    return headers or {}
+
+
+def is_rate_limit_error(exc):
+    """True for our RateLimitError and for the 429 errors raised by the provider SDKs"""
+    if isinstance(exc, RateLimitError):
+        return True
+    for attr in ("status_code", "code", "status"):
+        if getattr(exc, attr, None) == 429:
+            return True
+    response = getattr(exc, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    # google.api_core raises ResourceExhausted for 429s
+    return type(exc).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+def retry_after_from_error(exc):
+    """Seconds to wait according to the error itself, if the server said so"""
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after is not None:
+        return retry_after
+    headers = _response_headers(exc)
+    return _parse_duration(headers.get("retry-after") or headers.get("Retry-After"))
+
+
+def call_with_retry(call, limiter=None, estimated_tokens=0, max_retries=5, base_delay=1.0, max_delay=60.0,
+                    on_retry=None, acquired=False):
+    """Run call() under the provider limiter, retrying 429s with jittered exponential backoff
+
+    A Retry-After from the server takes precedence over the computed backoff
+    and pauses every in-flight caller of the same provider, not just this one.
+    on_retry(error, delay) is called before each retry. acquired=True means
+    the caller already took the limiter budget of the first attempt (e.g.
+    with acquire_async); retries always take their own.
+    """
+    attempt = 0
+    while True:
+        if limiter and not (acquired and attempt == 0):
+            limiter.acquire(estimated_tokens)
+        try:
+            return call()
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt >= max_retries:
+                raise
+            if limiter:
+                limiter.update_from_headers(_response_headers(e))
+            delay = retry_after_from_error(e)
+            if delay is None:
+                # Full jitter: spread retries out so callers don't stampede together
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if on_retry:
+                on_retry(e, delay)
+            if limiter:
+                limiter.pause(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
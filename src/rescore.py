@@ -0,0 +1,111 @@
+"""Re-score the stored answers after config/brands.json changes
+
+Each (run date, model) partition is read, its mention fields
+(alan_mentioned, brands_mentioned, brand_offsets) are recomputed from the
+response text and the partition is rewritten in place. Rows whose text was
+dropped by `python -m src dedup` take the fields of their cluster's
+canonical row, which is in the same partition.
+
+Detection costs about 0.1 ms per 3 KB answer, so 300k answers take about
+35 s on one core; --processes N re-scores N partitions at a time:
+
+    python -m src rescore --store data/results --processes 8
+"""
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+
+from .mentions import MentionDetector, load_brand_dictionary
+from .results_store import SCHEMA, ResultsStore
+
+MENTION_FIELDS = ["alan_mentioned", "brands_mentioned", "brand_offsets"]
+
+
+def rescore_table(table, detector):
+    """(table with the mention fields of its answered rows recomputed, number of rows changed)"""
+    rows = table.select(["status", "response", "cluster_id", *MENTION_FIELDS]).to_pydict()
+    # Parquet hands maps back as (key, value) lists
+    rows["brand_offsets"] = [dict(offsets) if offsets is not None else None for offsets in rows["brand_offsets"]]
+    columns = {name: list(rows[name]) for name in MENTION_FIELDS}
+    changed = 0
+
+    def assign(i, fields):
+        nonlocal changed
+        changed += any(fields[name] != rows[name][i] for name in MENTION_FIELDS)
+        for name in MENTION_FIELDS:
+            columns[name][i] = fields[name]
+
+    by_cluster = {}
+    pending = []
+    for i, status in enumerate(rows["status"]):
+        if status != "success":
+            continue
+        if rows["response"][i] is None:
+            pending.append(i)
+            continue
+        fields = detector.mention_fields(rows["response"][i])
+        if rows["cluster_id"][i] is not None:
+            by_cluster[rows["cluster_id"][i]] = fields
+        assign(i, fields)
+    for i in pending:
+        if rows["cluster_id"][i] in by_cluster:
+            assign(i, by_cluster[rows["cluster_id"][i]])
+
+    columns["brand_offsets"] = [None if offsets is None else list(offsets.items())
+                                for offsets in columns["brand_offsets"]]
+    for name in MENTION_FIELDS:
+        table = table.set_column(table.schema.get_field_index(name), name,
+                                 pa.array(columns[name], type=SCHEMA.field(name).type))
+    return table, changed
+
+
+def _rescore_partition(root, paths, brands):
+    """Re-score one partition in place (in a worker process); returns (rows, rows changed)"""
+    store = ResultsStore(root)
+    table = store.read_files(paths)
+    table, changed = rescore_table(table, MentionDetector(brands))
+    if changed:
+        store.replace_files(paths, table)
+    return table.num_rows, changed
+
+
+def rescore_store(store=None, brands=None, start_date=None, end_date=None, processes=1):
+    """Re-score every partition of the store in place; returns {(run_date, model): (rows, rows changed)}"""
+    store = store or ResultsStore()
+    brands = brands if brands is not None else load_brand_dictionary()
+    partitions = sorted(store.partitions(start_date, end_date).items())
+    if processes <= 1:
+        return {key: _rescore_partition(store.root, paths, brands) for key, paths in partitions}
+    # spawn: worker processes must not inherit the parent's threads or locks
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        futures = {key: pool.submit(_rescore_partition, store.root, paths, brands) for key, paths in partitions}
+        return {key: future.result() for key, future in futures.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute the brand mentions of stored answers")
+    parser.add_argument("--store", default='data/results')
+    parser.add_argument("--brands", default='config/brands.json', help="brand dictionary to score with")
+    parser.add_argument("--since", help="first run date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="last run date (YYYY-MM-DD)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="partitions re-scored in parallel (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    report = rescore_store(ResultsStore(args.store), load_brand_dictionary(args.brands), args.since, args.until,
+                           args.processes)
+    if not report:
+        print("Nothing to re-score")
+        return
+    for (run_date, model), (rows, changed) in report.items():
+        print(f"{run_date} {model:<24} {rows:>8} rows {changed:>8} changed")
+    print(f"{sum(rows for rows, _ in report.values())} rows re-scored, "
+          f"{sum(changed for _, changed in report.values())} changed")
+
+
+if __name__ == "__main__":
+    main()
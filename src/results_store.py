@@ -0,0 +1,210 @@
+import os
+import uuid
+from datetime import date, datetime
+from itertools import islice
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+CITATION = pa.struct([
+    ("type", pa.string()),
+    ("url", pa.string()),
+    ("title", pa.string()),
+    ("domain", pa.string()),
+    ("date", pa.string()),
+    ("file_id", pa.string()),
+    ("quote", pa.string()),
+])
+
+# Typed columns of the results dataset. Keys of a result row that are not
+# listed here are not persisted; run_date and model become the partition
+# directories rather than columns in the files.
+SCHEMA = pa.schema([
+    ("run_date", pa.string()),
+    ("model", pa.string()),
+    ("prompt", pa.string()),
+    ("prompt_id", pa.string()),
+    ("sweep_id", pa.string()),
+    ("run_number", pa.int32()),
+    ("timestamp", pa.timestamp("us")),
+    ("status", pa.string()),
+    ("error", pa.string()),
+    ("response", pa.string()),
+    ("alan_mentioned", pa.bool_()),
+    ("brands_mentioned", pa.list_(pa.string())),
+    ("brand_offsets", pa.map_(pa.string(), pa.int32())),
+    ("citations", pa.list_(CITATION)),
+    ("web_connected", pa.bool_()),
+    ("cached", pa.bool_()),
+    ("ttft_seconds", pa.float64()),
+    ("generation_seconds", pa.float64()),
+    ("stream_stop_reason", pa.string()),
+    ("batch_id", pa.string()),
+    ("latency_seconds", pa.float64()),
+    ("queue_seconds", pa.float64()),
+    ("retries", pa.int32()),
+    ("input_tokens", pa.int64()),
+    ("output_tokens", pa.int64()),
+    ("reasoning_tokens", pa.int64()),
+    ("web_search_calls", pa.int32()),
+    ("cost_usd", pa.float64()),
+    ("cluster_id", pa.string()),
+    ("canonical", pa.bool_()),
+])
+
+# Hive-style directories: <root>/run_date=2026-01-31/model=gpt-5/part-....parquet
+PARTITIONING = ds.partitioning(pa.schema([("run_date", pa.string()), ("model", pa.string())]), flavor="hive")
+
+
+class ResultsStore:
+    """Parquet dataset of result rows, partitioned by run date and model
+
+    Each write adds new files next to the existing ones, so successive sweeps
+    accumulate instead of overwriting each other. Loading reads only the
+    requested columns and the partitions matching the model/date filters.
+    """
+
+    def __init__(self, root='data/results'):
+        self.root = root
+
+    def write(self, results, run_date=None, sweep_id=None, on_write=None, batch_size=10000):
+        """Append result rows (any iterable, e.g. a ResultJournal); returns (written, skipped)
+
+        Writing is idempotent per (model, prompt, run_number) within a sweep
+        (sweep_id, e.g. the journal's name) and run date, so storing a resumed
+        journal again doesn't duplicate rows: rows already stored are skipped,
+        and a success replaces a stored error for the same key. Another sweep
+        on the same day is stored alongside. on_write(result) is called for
+        each row actually written.
+        """
+        run_date = str(run_date or date.today())
+        stored = self._stored_keys(run_date, sweep_id)
+        replaced = set()
+        results = iter(results)
+        written = skipped = 0
+        while True:
+            batch = list(islice(results, batch_size))
+            if not batch:
+                break
+            rows = []
+            for result in batch:
+                key = (result.get("model"), result.get("prompt"), result.get("run_number"))
+                success = result.get("status") == "success"
+                previous = stored.get(key)
+                if previous or (previous is not None and not success):
+                    skipped += 1
+                    continue
+                if previous is not None:
+                    replaced.add(key)
+                stored[key] = success
+                rows.append(self._to_row(result, run_date, sweep_id))
+                if on_write:
+                    on_write(result)
+            if rows:
+                self._write_table(pa.Table.from_pylist(rows, schema=SCHEMA))
+                written += len(rows)
+        if replaced:
+            self._drop_errors(run_date, sweep_id, replaced)
+        return written, skipped
+
+    @staticmethod
+    def _in_sweep(table, sweep_id):
+        """Mask of table's rows stored by sweep_id (rows stored without one for None)"""
+        if sweep_id is None:
+            return pc.is_null(table["sweep_id"])
+        return pc.fill_null(pc.equal(table["sweep_id"], sweep_id), False)
+
+    def _stored_keys(self, run_date, sweep_id):
+        """{(model, prompt, run_number): succeeded} of the rows stored by sweep_id for run_date"""
+        if not os.path.exists(self.root):
+            return {}
+        table = self.load_table(columns=["model", "prompt", "run_number", "status", "sweep_id"], start_date=run_date,
+                                end_date=run_date)
+        table = table.filter(self._in_sweep(table, sweep_id))
+        keys = zip(table["model"].to_pylist(), table["prompt"].to_pylist(), table["run_number"].to_pylist())
+        stored = {}
+        for key, status in zip(keys, table["status"].to_pylist()):
+            stored[key] = stored.get(key, False) or status == "success"
+        return stored
+
+    def _drop_errors(self, run_date, sweep_id, keys):
+        """Rewrite the run date's partitions without sweep_id's error rows for keys (now stored as successes)"""
+        models = {model for model, _, _ in keys}
+        for (_, model), paths in self.partitions(run_date, run_date).items():
+            if model not in models:
+                continue
+            table = self.read_files(paths)
+            rows = zip(table["model"].to_pylist(), table["prompt"].to_pylist(), table["run_number"].to_pylist(),
+                       table["status"].to_pylist(), self._in_sweep(table, sweep_id).to_pylist())
+            keep = [not (in_sweep and status != "success" and (m, prompt, run) in keys)
+                    for m, prompt, run, status, in_sweep in rows]
+            if not all(keep):
+                self.replace_files(paths, table.filter(pa.array(keep)))
+
+    def _write_table(self, table):
+        ds.write_dataset(
+            table,
+            self.root,
+            format="parquet",
+            partitioning=PARTITIONING,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+
+    def _to_row(self, result, run_date, sweep_id):
+        row = dict(result, run_date=run_date, sweep_id=sweep_id)
+        if isinstance(row.get("timestamp"), str):
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+        return row
+
+    def dataset(self):
+        # The explicit schema reads files written before a column was added (as nulls)
+        return ds.dataset(self.root, format="parquet", partitioning=PARTITIONING, schema=SCHEMA)
+
+    def load_table(self, columns=None, models=None, start_date=None, end_date=None, status=None):
+        """Load selected columns as an Arrow table, pruning partitions by model and run date"""
+        if not os.path.exists(self.root):
+            raise FileNotFoundError(f"No results stored under {self.root}")
+        condition = None
+        for expression in (
+            ds.field("model").isin(list(models)) if models else None,
+            ds.field("run_date") >= str(start_date) if start_date else None,
+            ds.field("run_date") <= str(end_date) if end_date else None,
+            ds.field("status") == status if status else None,
+        ):
+            if expression is not None:
+                condition = expression if condition is None else condition & expression
+        return self.dataset().to_table(columns=columns, filter=condition)
+
+    def partitions(self, start_date=None, end_date=None):
+        """{(run_date, model): [file paths]} of the stored partitions"""
+        partitions = {}
+        if not os.path.exists(self.root):
+            return partitions
+        for fragment in self.dataset().get_fragments():
+            keys = ds.get_partition_keys(fragment.partition_expression)
+            run_date = keys["run_date"]
+            if (start_date and run_date < str(start_date)) or (end_date and run_date > str(end_date)):
+                continue
+            partitions.setdefault((run_date, keys["model"]), []).append(fragment.path)
+        return partitions
+
+    def read_files(self, paths, columns=None):
+        """Columns (default all) of the given files of the dataset, partition columns included"""
+        return ds.dataset(paths, format="parquet", partitioning=PARTITIONING, schema=SCHEMA,
+                          partition_base_dir=self.root).to_table(columns=columns)
+
+    def replace_files(self, paths, table):
+        """Write table in place of the given files (e.g. a rewritten partition)
+
+        The new file is written before the old ones are removed, so an
+        interrupted rewrite leaves duplicate rows, never missing ones.
+        """
+        self._write_table(table.cast(SCHEMA))
+        for path in paths:
+            os.remove(path)
+
+    def load(self, columns=None, models=None, start_date=None, end_date=None, status=None):
+        """Same as load_table(), as a pandas DataFrame"""
+        return self.load_table(columns, models, start_date, end_date, status).to_pandas()
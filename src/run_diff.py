@@ -0,0 +1,299 @@
+"""Run-over-run comparison: what changed since the baseline sweep
+
+RunIndex keeps one small JSON summary per run date under data/run_index:
+for every (model, prompt id) cell, the answers, each brand's mentions and
+mention ranks (1 = named first), and the domains cited. A run date is
+summarized once from its own partitions of the results store, and again only
+when its files change (another sweep that day, a dedup pass), so comparing
+two runs reads two summaries however long the history grows.
+
+diff_runs() compares a run with a baseline (by default the run before it):
+mention-rate, mean-rank and citation-share deltas per model and per cell,
+with a two-proportion z-test (rates, shares) or Welch z-test (ranks) and
+Benjamini-Hochberg q-values across the cells compared:
+
+    python -m src diff --baseline 2026-01-01
+"""
+import argparse
+import json
+import math
+import os
+from statistics import NormalDist
+
+from .citations import normalize_domain
+from .prompts import prompt_id
+from .results_store import ResultsStore
+
+INDEX_COLUMNS = ["model", "prompt", "prompt_id", "status", "brands_mentioned", "citations"]
+
+
+def summarize_table(table):
+    """[cell summary] of a table of stored rows: one per (model, prompt id), successful answers only"""
+    cells = {}
+    rows = table.to_pydict()
+    for i in range(table.num_rows):
+        if rows["status"][i] != "success":
+            continue
+        prompt = rows["prompt"][i]
+        key = (rows["model"][i], rows["prompt_id"][i] or prompt_id(prompt))
+        cell = cells.setdefault(key, {"model": key[0], "prompt_id": key[1], "prompt": prompt, "answers": 0,
+                                      "brands": {}, "domains": {}})
+        cell["answers"] += 1
+        # brands_mentioned is in order of first mention, so position is rank
+        for rank, brand in enumerate(rows["brands_mentioned"][i] or (), 1):
+            stats = cell["brands"].setdefault(brand, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += rank
+            stats[2] += rank * rank
+        domains = {citation.get("domain") or normalize_domain(citation.get("url"))
+                   for citation in rows["citations"][i] or ()}
+        for domain in domains - {None}:
+            cell["domains"][domain] = cell["domains"].get(domain, 0) + 1
+    return list(cells.values())
+
+
+class RunIndex:
+    """Per-run-date cell summaries of a results store, refreshed incrementally
+
+    Each <root>/<run_date>.json holds {"files": [...], "cells": [...]}; the
+    file list is that of the date's partitions when it was summarized.
+    """
+
+    def __init__(self, root='data/run_index', store=None):
+        self.root = root
+        self.store = store or ResultsStore()
+
+    def path(self, run_date):
+        return os.path.join(self.root, f"{run_date}.json")
+
+    def run_dates(self):
+        """Summarized run dates, oldest first"""
+        if not os.path.exists(self.root):
+            return []
+        return sorted(name[:-len(".json")] for name in os.listdir(self.root) if name.endswith(".json"))
+
+    def load(self, run_date):
+        path = self.path(run_date)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Run {run_date} is not indexed under {self.root}")
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def update(self, start_date=None, end_date=None):
+        """Summarize the run dates whose files changed since last time; returns those dates"""
+        by_date = {}
+        for (run_date, _), paths in self.store.partitions(start_date, end_date).items():
+            by_date.setdefault(run_date, []).extend(paths)
+        refreshed = []
+        for run_date, paths in sorted(by_date.items()):
+            files = sorted(os.path.relpath(path, self.store.root) for path in paths)
+            if os.path.exists(self.path(run_date)) and self.load(run_date)["files"] == files:
+                continue
+            cells = summarize_table(self.store.read_files(paths, columns=INDEX_COLUMNS))
+            self._save(run_date, {"files": files, "cells": cells})
+            refreshed.append(run_date)
+        return refreshed
+
+    def _save(self, run_date, summary):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(run_date)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def previous(self, run_date):
+        """The latest summarized run date before run_date, or None"""
+        earlier = [other for other in self.run_dates() if other < str(run_date)]
+        return earlier[-1] if earlier else None
+
+
+def proportion_test(x1, n1, x2, n2):
+    """Two-sided p-value of a pooled two-proportion z-test; 1.0 when undefined"""
+    if not n1 or not n2:
+        return 1.0
+    pooled = (x1 + x2) / (n1 + n2)
+    variance = pooled * (1 - pooled) * (1 / n1 + 1 / n2)
+    if variance == 0:
+        return 1.0
+    z = (x2 / n2 - x1 / n1) / math.sqrt(variance)
+    return 2 * (1 - NormalDist().cdf(abs(z)))
+
+
+def mean_test(n1, sum1, sq1, n2, sum2, sq2):
+    """Two-sided p-value of a Welch z-test on two means given count, sum and sum of squares"""
+    if n1 < 2 or n2 < 2:
+        return 1.0
+    mean1, mean2 = sum1 / n1, sum2 / n2
+    var1 = (sq1 - n1 * mean1 * mean1) / (n1 - 1)
+    var2 = (sq2 - n2 * mean2 * mean2) / (n2 - 1)
+    standard_error = math.sqrt(max(var1, 0) / n1 + max(var2, 0) / n2)
+    if standard_error == 0:
+        return 1.0 if mean1 == mean2 else 0.0
+    return 2 * (1 - NormalDist().cdf(abs(mean2 - mean1) / standard_error))
+
+
+def benjamini_hochberg(pvalues):
+    """q-values (false discovery rate adjusted p-values), in the order given"""
+    order = sorted(range(len(pvalues)), key=lambda i: pvalues[i])
+    qvalues = [1.0] * len(pvalues)
+    running = 1.0
+    for position in range(len(order) - 1, -1, -1):
+        i = order[position]
+        running = min(running, pvalues[i] * len(pvalues) / (position + 1))
+        qvalues[i] = running
+    return qvalues
+
+
+def _combine(cells, key):
+    """Sum cell summaries grouped by key(cell)"""
+    groups = {}
+    for cell in cells:
+        group = groups.setdefault(key(cell), {"answers": 0, "brands": {}, "domains": {}})
+        group["answers"] += cell["answers"]
+        for brand, stats in cell["brands"].items():
+            total = group["brands"].setdefault(brand, [0, 0, 0])
+            for position, value in enumerate(stats):
+                total[position] += value
+        for domain, count in cell["domains"].items():
+            group["domains"][domain] = group["domains"].get(domain, 0) + count
+    return groups
+
+
+def _compare(base, current, brand):
+    n1, n2 = base["answers"], current["answers"]
+    m1, r1, s1 = base["brands"].get(brand, [0, 0, 0])
+    m2, r2, s2 = current["brands"].get(brand, [0, 0, 0])
+    return {
+        "answers_base": n1,
+        "answers": n2,
+        "rate_base": m1 / n1 if n1 else None,
+        "rate": m2 / n2 if n2 else None,
+        "rate_delta": m2 / n2 - m1 / n1 if n1 and n2 else None,
+        "rate_p": proportion_test(m1, n1, m2, n2),
+        "rank_base": r1 / m1 if m1 else None,
+        "rank": r2 / m2 if m2 else None,
+        "rank_delta": r2 / m2 - r1 / m1 if m1 and m2 else None,
+        "rank_p": mean_test(m1, r1, s1, m2, r2, s2),
+    }
+
+
+def _flag(rows, columns, alpha):
+    """Add <name>_q and significant to rows, adjusting each p-value column across rows"""
+    for name in columns:
+        for row, q in zip(rows, benjamini_hochberg([row[f"{name}_p"] for row in rows])):
+            row[f"{name}_q"] = q
+    for row in rows:
+        row["significant"] = any(row[f"{name}_q"] < alpha for name in columns)
+    return rows
+
+
+def diff_runs(index, current=None, baseline=None, brand='Alan', alpha=0.05):
+    """Deltas between two summarized runs: {"current", "baseline", "models", "cells", "domains", "new", "dropped"}
+
+    Only (model, prompt id) cells present in both runs are compared, so a
+    prompt added to the matrix doesn't move a model's rate; "new" and
+    "dropped" count the others. Rows are sorted significant first, then by
+    the size of the change.
+    """
+    dates = index.run_dates()
+    current = str(current or (dates[-1] if dates else ""))
+    baseline = str(baseline or index.previous(current) or "")
+    if not current:
+        raise ValueError("No indexed runs to compare (see RunIndex.update)")
+    if not baseline:
+        raise ValueError(f"No indexed run before {current} to compare it with")
+    base_cells = {(c["model"], c["prompt_id"]): c for c in index.load(baseline)["cells"]}
+    current_cells = {(c["model"], c["prompt_id"]): c for c in index.load(current)["cells"]}
+    common = sorted(base_cells.keys() & current_cells.keys())
+
+    cells = [{"model": key[0], "prompt_id": key[1], "prompt": current_cells[key]["prompt"],
+              **_compare(base_cells[key], current_cells[key], brand)} for key in common]
+    base_models = _combine((base_cells[key] for key in common), key=lambda cell: cell["model"])
+    current_models = _combine((current_cells[key] for key in common), key=lambda cell: cell["model"])
+    models = [{"model": model, **_compare(base_models[model], current_models[model], brand)}
+              for model in sorted(current_models)]
+
+    domains = []
+    for model in sorted(current_models):
+        base, now = base_models[model], current_models[model]
+        for domain in sorted(base["domains"].keys() | now["domains"].keys()):
+            c1, c2 = base["domains"].get(domain, 0), now["domains"].get(domain, 0)
+            domains.append({"model": model, "domain": domain, "share_base": c1 / base["answers"],
+                            "share": c2 / now["answers"], "share_delta": c2 / now["answers"] - c1 / base["answers"],
+                            "share_p": proportion_test(c1, base["answers"], c2, now["answers"])})
+
+    _flag(models, ("rate", "rank"), alpha)
+    _flag(cells, ("rate", "rank"), alpha)
+    _flag(domains, ("share",), alpha)
+    return {
+        "current": current,
+        "baseline": baseline,
+        "models": models,
+        "cells": sorted(cells, key=lambda row: (not row["significant"], -abs(row["rate_delta"] or 0))),
+        "domains": sorted(domains, key=lambda row: (not row["significant"], -abs(row["share_delta"]))),
+        "new": len(current_cells.keys() - base_cells.keys()),
+        "dropped": len(base_cells.keys() - current_cells.keys()),
+    }
+
+
+def _percent(value):
+    return f"{value:.0%}" if value is not None else "-"
+
+
+def _rank(value):
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def _delta(value, percent=True):
+    if value is None:
+        return "-"
+    return f"{value * 100:+.0f}pt" if percent else f"{value:+.2f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare a run with a baseline run")
+    parser.add_argument("--store", default='data/results')
+    parser.add_argument("--index", default='data/run_index', help="directory of the per-run summaries")
+    parser.add_argument("--current", help="run date to compare (default: the latest)")
+    parser.add_argument("--baseline", help="run date to compare against (default: the run before --current)")
+    parser.add_argument("--brand", default='Alan')
+    parser.add_argument("--alpha", type=float, default=0.05, help="false discovery rate for flagging changes")
+    parser.add_argument("--all", action="store_true", help="list every cell and domain, not just significant ones")
+    args = parser.parse_args(argv)
+
+    index = RunIndex(args.index, ResultsStore(args.store))
+    refreshed = index.update()
+    if refreshed:
+        print(f"Indexed {len(refreshed)} run(s): {', '.join(refreshed)}")
+    try:
+        diff = diff_runs(index, args.current, args.baseline, args.brand, args.alpha)
+    except (ValueError, FileNotFoundError) as e:
+        # Fewer than two runs, or an unknown --current/--baseline date
+        raise SystemExit(f"{e}\nIndexed runs: {', '.join(index.run_dates()) or 'none'}")
+    print(f"\n{args.brand}: {diff['current']} vs {diff['baseline']} "
+          f"({len(diff['cells'])} cells compared, {diff['new']} new, {diff['dropped']} dropped)")
+
+    print(f"\n{'model':<28} {'answers':>8} {'rate':>11} {'change':>7} {'rank':>11} {'change':>7}  q")
+    for row in diff["models"]:
+        print(f"{row['model']:<28} {row['answers']:>8} {_percent(row['rate_base']):>4} -> {_percent(row['rate']):<4} "
+              f"{_delta(row['rate_delta']):>7} {_rank(row['rank_base']):>4} -> {_rank(row['rank']):<4} "
+              f"{_delta(row['rank_delta'], percent=False):>7}  {min(row['rate_q'], row['rank_q']):.3f}"
+              f"{' *' if row['significant'] else ''}")
+
+    cells = [row for row in diff["cells"] if args.all or row["significant"]]
+    print(f"\n{len(cells)} cell(s){'' if args.all else ' changed significantly'}")
+    for row in cells:
+        print(f"{row['model']:<28} {_percent(row['rate_base']):>4} -> {_percent(row['rate']):<4} "
+              f"{_delta(row['rate_delta']):>7} rank {_rank(row['rank_base'])} -> {_rank(row['rank'])}  "
+              f"{row['prompt'][:60]}")
+
+    domains = [row for row in diff["domains"] if args.all or row["significant"]]
+    print(f"\n{len(domains)} cited domain(s){'' if args.all else ' changed significantly'}")
+    for row in domains:
+        print(f"{row['model']:<28} {row['domain']:<36} {_percent(row['share_base']):>4} -> "
+              f"{_percent(row['share']):<4} {_delta(row['share_delta']):>7}")
+
+
+if __name__ == "__main__":
+    main()
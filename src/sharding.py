@@ -0,0 +1,126 @@
+"""Split a sweep across processes or machines
+
+Every (model, prompt, run_number) call is assigned to one of N shards by a
+stable hash of its key, so N workers started with `--shard 1/N` ... `--shard
+N/N` (on one machine or many) make every call exactly once, without any
+coordination. Each shard journals to its own file (by default in a new
+data/shards/<timestamp> directory per sweep); merge_journals() combines the
+shard journals afterwards:
+
+    python -m src run --shard 2/4 --journal data/shards/2026-01-01/shard-2-of-4.jsonl
+    python -m src merge data/shards/2026-01-01
+
+run_sharded() does the same on one machine with a process pool, so response
+parsing and mention scoring use every core.
+"""
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .journal import ResultJournal, result_key
+
+
+def parse_shard(spec):
+    """Parse "i/N" (1 <= i <= N) into (i, N)"""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {spec!r}, expected i/N such as 1/4") from None
+    if not 1 <= index <= count:
+        raise ValueError(f"Invalid shard {spec!r}: i must be between 1 and N")
+    return index, count
+
+
+def shard_of(key, count):
+    """Shard (1..count) of a (model, prompt, run_number) key
+
+    Uses sha1 rather than hash(), which is salted per process.
+    """
+    digest = hashlib.sha1(json.dumps(list(key), ensure_ascii=False).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def in_shard(key, shard):
+    index, count = shard
+    return count == 1 or shard_of(key, count) == index
+
+
+def shard_journal_path(directory, index, count):
+    return os.path.join(directory, f"shard-{index}-of-{count}.jsonl")
+
+
+def scale_rate_limits(limits, count):
+    """Each shard's share of per-provider quotas that all shards draw from"""
+    return {
+        name: {field: (value / count if value else value) for field, value in values.items()}
+        for name, values in limits.items()
+    }
+
+
+def merge_journals(paths):
+    """Yield one row per key across shard journals
+
+    A success wins over an error for the same key (an errored call retried on
+    resume), otherwise the last row read wins.
+    """
+    merged = {}
+    for path in paths:
+        for result in ResultJournal(path):
+            key = result_key(result)
+            previous = merged.get(key)
+            if previous is None or result.get("status") == "success" or previous.get("status") != "success":
+                merged[key] = result
+    yield from merged.values()
+
+
+def shard_journals(directory):
+    """Shard journals written under directory, in shard order"""
+    def index(path):
+        return int(os.path.basename(path).split("-")[1])
+    return sorted(glob.glob(os.path.join(directory, "shard-*-of-*.jsonl")), key=index)
+
+
+def _run_shard(shard, directory, runner_options, run_options):
+    # Runs in a worker process: providers (clients, locks, sessions) are built here
+    from .llm_runner import LLMRunner
+
+    runner = LLMRunner(**runner_options)
+    journal = ResultJournal(shard_journal_path(directory, *shard))
+    runner.run_all_tests(journal=journal, shard=shard, **run_options)
+    return journal.path
+
+
+def run_sharded(directory, processes, runner_options=None, num_iterations=1, prompts=None, max_concurrency=8,
+                resume=False):
+    """Run the sweep as `processes` shards in a process pool and return the shard journal paths
+
+    runner_options are LLMRunner keyword arguments and are pickled to the
+    workers (model entries, rate limit dicts, a ResponseCache). Rate limits
+    are split evenly between the shards. Each shard runs the concurrent path
+    with max_concurrency calls in flight.
+    """
+    runner_options = dict(runner_options or {})
+    if runner_options.get("rate_limits") is None:
+        from .rate_limiter import load_rate_limits
+        runner_options["rate_limits"] = load_rate_limits()
+    runner_options["rate_limits"] = scale_rate_limits(runner_options["rate_limits"], processes)
+    run_options = {
+        "num_iterations": num_iterations,
+        "prompts": prompts,
+        "concurrent": True,
+        "max_concurrency": max_concurrency,
+        "resume": resume,
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    # spawn: worker processes must not inherit the parent's threads, locks or sockets
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        futures = [
+            pool.submit(_run_shard, (index, processes), directory, runner_options, run_options)
+            for index in range(1, processes + 1)
+        ]
+        return [future.result() for future in futures]
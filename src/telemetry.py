@@ -0,0 +1,187 @@
+"""Per-call telemetry: token usage, cost and live per-model counters
+
+Providers report usage as flat row fields (USAGE_FIELDS); output_tokens
+always includes reasoning tokens, which every provider bills as output.
+Provider.ask() adds latency_seconds (the API calls alone), queue_seconds
+(waiting on our rate limiter, and for a worker thread in concurrent runs) and retries, and success_row() prices
+the call with the model's entry in config/prices.json:
+
+    {"gpt-5": {"input_per_million": 1.25, "output_per_million": 10.0,
+               "web_search_per_thousand": 10.0, "batch_discount": 0.5}}
+"""
+import contextlib
+import json
+import os
+import threading
+
+from .citations import field
+
+USAGE_FIELDS = ("input_tokens", "output_tokens", "reasoning_tokens", "web_search_calls")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def usage_fields(input_tokens=None, output_tokens=None, reasoning_tokens=None, web_search_calls=None):
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "reasoning_tokens": reasoning_tokens,
+            "web_search_calls": web_search_calls}
+
+
+def openai_usage(response):
+    """Usage of a Responses API response (SDK object or raw JSON body)"""
+    usage = field(response, "usage")
+    searches = sum(1 for item in field(response, "output") or [] if field(item, "type") == "web_search_call")
+    if usage is None:
+        return usage_fields(web_search_calls=searches)
+    return usage_fields(
+        field(usage, "input_tokens"),
+        field(usage, "output_tokens"),
+        field(field(usage, "output_tokens_details"), "reasoning_tokens"),
+        searches,
+    )
+
+
+def chat_usage(usage, web_search_calls=None):
+    """Usage block of a chat completion (Mistral, Perplexity): prompt/completion tokens"""
+    if usage is None:
+        return usage_fields(web_search_calls=web_search_calls)
+    return usage_fields(
+        field(usage, "prompt_tokens"),
+        field(usage, "completion_tokens"),
+        field(usage, "reasoning_tokens"),
+        web_search_calls if web_search_calls is not None else field(usage, "num_search_queries"),
+    )
+
+
+def gemini_usage(response):
+    """usage_metadata of a Gemini response; thinking tokens are counted apart from candidates"""
+    usage = field(response, "usage_metadata")
+    if usage is None:
+        return usage_fields()
+    reasoning = field(usage, "thoughts_token_count") or 0
+    output = field(usage, "candidates_token_count")
+    return usage_fields(
+        field(usage, "prompt_token_count"),
+        output + reasoning if output is not None else None,
+        reasoning or None,
+    )
+
+
+def load_prices(path='config/prices.json'):
+    """Price table: model name -> USD rates (see module docstring)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def call_cost(price, row):
+    """USD cost of one call from its usage fields, or None if unpriced or usage unknown"""
+    if not price or row.get("input_tokens") is None or row.get("output_tokens") is None:
+        return None
+    cost = (row["input_tokens"] * price.get("input_per_million", 0.0)
+            + row["output_tokens"] * price.get("output_per_million", 0.0)) / 1e6
+    cost += (row.get("web_search_calls") or 0) * price.get("web_search_per_thousand", 0.0) / 1000
+    cost += price.get("request_per_thousand", 0.0) / 1000
+    if row.get("batch_id"):
+        cost *= price.get("batch_discount", 1.0)
+    return round(cost, 8)
+
+
+class Telemetry:
+    """Thread-safe running counters per model, updated as results come in
+
+    snapshot() can be called from another thread while a sweep runs.
+    Cached answers are counted apart: they cost nothing and took no time.
+    Besides the recorded results, the runner reports calls while they are sent
+    to the API (in_flight; calls waiting on our rate limiter are not) and 429s as they are retried (rate_limited), and how
+    many calls it expects to make, for live progress (see monitor.py).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.models = {}
+        self.expected = 0
+
+    def _stats(self, model):
+        return self.models.setdefault(model, {
+            "calls": 0, "errors": 0, "cached": 0, "retries": 0, "latencies": [], "in_flight": 0, "rate_limited": 0,
+            "input_tokens": 0, "output_tokens": 0, "reasoning_tokens": 0, "web_search_calls": 0, "cost_usd": 0.0,
+            "queue_seconds": 0.0,
+        })
+
+    def record(self, result):
+        with self.lock:
+            stats = self._stats(result.get("model"))
+            if result.get("cached"):
+                stats["cached"] += 1
+                return
+            stats["calls"] += 1
+            if result.get("status") != "success":
+                stats["errors"] += 1
+            stats["retries"] += result.get("retries") or 0
+            if result.get("latency_seconds") is not None:
+                stats["latencies"].append(result["latency_seconds"])
+            for name in (*USAGE_FIELDS, "cost_usd", "queue_seconds"):
+                stats[name] += result.get(name) or 0
+
+    def update(self, results):
+        for result in results:
+            self.record(result)
+        return self
+
+    def expect(self, calls):
+        """Add calls to the number the sweep is expected to make"""
+        with self.lock:
+            self.expected += calls
+
+    def start(self, model):
+        with self.lock:
+            self._stats(model)["in_flight"] += 1
+
+    def finish(self, model):
+        with self.lock:
+            self._stats(model)["in_flight"] -= 1
+
+    @contextlib.contextmanager
+    def sending(self, model):
+        """Count a call in flight for the duration of the block"""
+        self.start(model)
+        try:
+            yield
+        finally:
+            self.finish(model)
+
+    def rate_limit(self, model):
+        """Count a 429 as it happens (record() only sees retries once the call is done)"""
+        with self.lock:
+            self._stats(model)["rate_limited"] += 1
+
+    def snapshot(self):
+        """Per-model counters with latency percentiles, as plain dicts"""
+        with self.lock:
+            models = {model: dict(stats, latencies=sorted(stats["latencies"])) for model, stats in self.models.items()}
+        for stats in models.values():
+            latencies = stats.pop("latencies")
+            stats["latency_p50"] = percentile(latencies, 50)
+            stats["latency_p95"] = percentile(latencies, 95)
+            stats["latency_max"] = latencies[-1] if latencies else None
+            stats["latency_count"] = len(latencies)
+            stats["latency_sum"] = sum(latencies)
+        return models
+
+    def format_table(self):
+        lines = [f"{'model':<28} {'calls':>6} {'errors':>6} {'cached':>6} {'retries':>7} {'p50 s':>7} {'p95 s':>7} "
+                 f"{'in tok':>9} {'out tok':>9} {'reason':>8} {'search':>6} {'cost $':>9}"]
+        for model, s in sorted(self.snapshot().items(), key=lambda item: str(item[0])):
+            p50 = f"{s['latency_p50']:.2f}" if s["latency_p50"] is not None else "-"
+            p95 = f"{s['latency_p95']:.2f}" if s["latency_p95"] is not None else "-"
+            lines.append(f"{str(model):<28} {s['calls']:>6} {s['errors']:>6} {s['cached']:>6} {s['retries']:>7} "
+                         f"{p50:>7} {p95:>7} {s['input_tokens']:>9} {s['output_tokens']:>9} "
+                         f"{s['reasoning_tokens']:>8} {s['web_search_calls']:>6} {s['cost_usd']:>9.4f}")
+        return "\n".join(lines)